@@ -48,6 +48,10 @@ def check_pyqt6():
     """检查 PyQt6"""
     return check_package("PyQt6", "PyQt6.QtWidgets")
 
+def check_numpy():
+    """检查 NumPy"""
+    return check_package("NumPy", "numpy")
+
 def check_pygame():
     """检查 Pygame"""
     return check_package("Pygame", "pygame")
@@ -69,6 +73,7 @@ def main():
     
     # 检查必需的包
     pyqt6_ok = check_pyqt6()
+    numpy_ok = check_numpy()
     pygame_ok = check_package("json")  # json 是内置的
     
     print()
@@ -79,6 +84,12 @@ def main():
         if choice == 'y':
             install_package("PyQt6")
     
+    if not numpy_ok:
+        print("NumPy 未安装（地图生成器 mapDesigner.py 需要）")
+        choice = input("是否现在安装 NumPy？(y/n): ").strip().lower()
+        if choice == 'y':
+            install_package("numpy")
+    
     print()
     print("检查 Pygame（仅在使用旧版编辑器时需要）...")
     pygame_ok = check_pygame()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+已解析地图的二进制缓存
+
+以 (路径, mtime, 大小) 为键，把各图层的编码网格、其余字段和读取信息（原格子写法、
+参差行）存为 .npz；文件未变化时直接读取缓存，跳过 JSON 解析。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from mapGrid import cell_format_of, codes_from_rows, ragged_rows
+from mapLayers import TERRAIN, extract_layer_grids
+
+
+CACHE_DIRNAME = ".map_cache"
+CACHE_VERSION = 3
+
+
+def cache_path(filepath, cache_dir):
+    """地图文件对应的缓存文件路径"""
+    name = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, name + ".npz")
+
+
+def file_key(filepath):
+    """缓存键：绝对路径 + mtime + 大小"""
+    st = os.stat(filepath)
+    return "{}|{}|{}|{}".format(CACHE_VERSION, os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+
+
+def load_cached(filepath, cache_dir):
+    """读取缓存，返回 (地图数据, {图层名: 编码网格}, 读取信息)；缓存不存在或已过期时返回 None"""
+    path = cache_path(filepath, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['key']) != file_key(filepath):
+                return None
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            grids = {name[len("grid_"):]: data[name] for name in data.files if name.startswith("grid_")}
+    except Exception:
+        return None
+    return meta['map_data'], grids, meta['info']
+
+
+def store_cache(filepath, cache_dir, map_data, grids, info):
+    """写入缓存（失败时静默忽略，缓存只是加速手段）"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        info = {k: v for k, v in info.items() if k != 'cached'}
+        meta = json.dumps({"map_data": map_data, "info": info}, ensure_ascii=False)
+        path = cache_path(filepath, cache_dir)
+        tmp_path = path + ".tmp.npz"
+        arrays = {"grid_" + name: codes for name, codes in grids.items()}
+        np.savez(tmp_path, key=np.array(file_key(filepath)),
+                 meta=np.frombuffer(meta.encode('utf-8'), dtype=np.uint8), **arrays)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+
+def read_map(filepath, cache_dir):
+    """读取地图，优先使用缓存；返回 (地图数据, {图层名: 编码网格}, 读取信息)
+
+    网格中 terrain 即顶层 map 字段，其余为文件中 layers 里保存的图层。
+    读取信息包含 cell_format（原格子写法）、ragged（参差行）与 cached（是否命中缓存）。
+    """
+    cached = load_cached(filepath, cache_dir)
+    if cached is not None:
+        map_data, grids, info = cached
+        info['cached'] = True
+        return map_data, grids, info
+    with open(filepath, 'r', encoding='utf-8') as f:
+        map_data = json.load(f)
+    rows = map_data.pop('map', [])
+    info = {"cell_format": cell_format_of(rows), "ragged": ragged_rows(rows)}
+    grids = extract_layer_grids(map_data)
+    grids[TERRAIN] = codes_from_rows(rows)
+    store_cache(filepath, cache_dir, map_data, grids, info)
+    info['cached'] = False
+    return map_data, grids, info
@@ -1,5 +1,11 @@
-import json
+import argparse
 import os
+import sys
+import time
+
+import numpy as np
+
+from mapGrid import CELL_CODE, CELL_TILE, CODE_DTYPE, label_regions, map_info_for, write_map
 
 mapbase = [
     # 0 ---------------- 外围顶边全是 2 ----------------
@@ -39,20 +45,24 @@ mapbase = [
 TILE_INFO = {
     1: {
         "code": 1,
-        "name": "back_stone", 
-        "path": "", 
-        "walkable": False, 
+        "name": "back_stone",
+        "path": "",
+        "walkable": False,
         "upThroughable": False
         },
     2: {
         "code": 2,
-        "name": "stone", 
-        "path": "Materials/map/Tiles/castleCenter.png", 
+        "name": "stone",
+        "path": "Materials/map/Tiles/castleCenter.png",
         "walkable": True,
         "upThroughable": False
         }
 }
 
+# 背景（可活动空间）与实心地砖的 code
+AIR = 1
+SOLID = 2
+
 MAP_INFO = {
     "height": len(mapbase) * 100,
     "width": len(mapbase[0]) * 100,
@@ -65,7 +75,7 @@ Entity = [
         "position":[1000,300]
     }
 ]
-    
+
 
 
 playerSpawn = {
@@ -78,26 +88,212 @@ enemy = [
     {"id": 2, "spawn": [300, 300], "delay": 0},
     {"id": 1, "spawn": [800, 300], "delay": 0}#How many times it should spawn after game start
 ]
-    
+
 mapName = "start_cave"
 
-gameMap = [[TILE_INFO[tile] for tile in row] for row in mapbase]
 
-#下方为json打包
+def build_start_cave():
+    """手工绘制的 start_cave，返回 (地图数据, 编码网格)"""
+    codes = np.array(mapbase, dtype=CODE_DTYPE)
+    mapData = {
+        "name": mapName,
+        "playerSpawn": playerSpawn,
+        "enemy": enemy,
+        "tile_info": TILE_INFO,
+        "map_info": MAP_INFO,
+        "entity": Entity,
+    }
+    return mapData, codes
 
-mapData = {
-    "name": mapName,
-    "playerSpawn": playerSpawn,
-    "enemy": enemy,
-    "tile_info": TILE_INFO,
-    "map_info": MAP_INFO,
-    "map": gameMap,
-    "entity": Entity,
-}
 
-basepath = os.path.dirname(os.path.abspath(__file__))
-filename = f"{mapName}.json"
-filepath = os.path.join(basepath, filename)
+def neighbor_count(wall):
+    """统计每格 8 邻域内的墙数，界外按墙计（3x3 盒式求和按行列拆开）"""
+    p = np.pad(wall, 1, constant_values=True).view(np.uint8)
+    v = p[:-2] + p[1:-1] + p[2:]
+    box = v[:, :-2] + v[:, 1:-1] + v[:, 2:]
+    return box - wall.view(np.uint8)
+
+
+def cellular_caves(rows, cols, rng, fill=0.45, birth=5, survive=4, steps=5):
+    """元胞自动机洞穴：随机撒墙后按 birth/survive 规则迭代，返回墙的布尔网格"""
+    wall = rng.random((rows, cols)) < fill
+    for _ in range(steps):
+        n = neighbor_count(wall)
+        wall = np.where(wall, n >= survive, n >= birth)
+    return wall
+
+
+def add_border(wall, border=1):
+    """四周加上 border 格厚的外墙"""
+    if border > 0:
+        wall[:border, :] = True
+        wall[-border:, :] = True
+        wall[:, :border] = True
+        wall[:, -border:] = True
+    return wall
+
+
+def fill_pockets(wall):
+    """只保留最大的连通空腔，其余封闭小空腔填成墙"""
+    labels = label_regions(~wall)
+    if labels.max() < 0:
+        return wall
+    sizes = np.bincount(labels[labels >= 0])
+    return labels != int(np.argmax(sizes))
+
+
+def _window_all(mask, length, axis):
+    """沿 axis 方向长度为 length 的窗口是否全为真（结果对齐到窗口起点）
+
+    用错位相与按倍增方式扩展窗口，只需 log(length) 次布尔运算。
+    """
+    out = np.moveaxis(mask, axis, 0)
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        out = out[:-step] & out[step:]
+        covered += step
+    return np.moveaxis(out, 0, axis)
+
+
+def place_platforms(wall, rng, count, length=4, clearance=2):
+    """在开阔空腔中放置水平平台
+
+    平台上下 clearance 行、两端各一格都必须是空腔，保证平台不会切断通路。
+    """
+    if count <= 0:
+        return wall
+    air = ~wall
+    span = 2 * clearance + 1
+    vertical = _window_all(air, span, axis=0)
+    clear = _window_all(vertical, length + 2, axis=1)
+    r, c = np.nonzero(clear)
+    if r.size == 0:
+        return wall
+    pick = rng.choice(r.size, size=min(count, r.size), replace=False)
+    r = r[pick] + clearance
+    c = c[pick] + 1
+    wall = wall.copy()
+    wall[r[:, None], c[:, None] + np.arange(length)] = True
+    return wall
+
+
+def reachable_floor(wall):
+    """可站立的地面：属于最大空腔、且正下方是墙的空格"""
+    labels = label_regions(~wall)
+    if labels.max() < 0:
+        return np.zeros_like(wall)
+    sizes = np.bincount(labels[labels >= 0])
+    main = int(np.argmax(sizes))
+    floor = np.zeros_like(wall)
+    floor[:-1] = (labels[:-1] == main) & wall[1:]
+    return floor
+
+
+def place_actors(floor, rng, tilesize, enemies=10, enemy_ids=(1, 2), min_distance=8):
+    """在可达地面上选出玩家生成点和敌人生成点（像素坐标）"""
+    r, c = np.nonzero(floor)
+    if r.size == 0:
+        raise ValueError(u"地图中没有可站立的地面")
+    i = int(rng.integers(r.size))
+    sr, sc = int(r[i]), int(c[i])
+    spawn = {"x": sc * tilesize, "y": sr * tilesize}
+
+    far = (r - sr) ** 2 + (c - sc) ** 2 >= min_distance ** 2
+    cand = np.flatnonzero(far)
+    if cand.size < enemies:
+        cand = np.delete(np.arange(r.size), i)
+    pick = rng.choice(cand, size=min(enemies, cand.size), replace=False)
+    ids = rng.choice(np.asarray(enemy_ids), size=pick.size)
+    enemy_list = [
+        {"id": int(eid), "spawn": [int(x) * tilesize, int(y) * tilesize], "delay": 0}
+        for eid, x, y in zip(ids, c[pick], r[pick])
+    ]
+    return spawn, enemy_list
+
+
+def generate_cave(width, height, seed=None, fill=0.45, birth=5, survive=4, steps=5,
+                  border=1, platforms=None, platform_length=4, enemies=10,
+                  tilesize=100, name="generated_cave", keep_pockets=False):
+    """按参数生成洞穴地图，返回 (地图数据, 编码网格)"""
+    rng = np.random.default_rng(seed)
+    wall = cellular_caves(height, width, rng, fill, birth, survive, steps)
+    wall = add_border(wall, border)
+    if not keep_pockets:
+        wall = fill_pockets(wall)
+    if platforms is None:
+        platforms = width * height // 400
+    wall = place_platforms(wall, rng, platforms, platform_length)
+    floor = reachable_floor(wall)
+    spawn, enemy_list = place_actors(floor, rng, tilesize, enemies)
+
+    codes = np.where(wall, SOLID, AIR).astype(CODE_DTYPE)
+    map_data = {
+        "name": name,
+        "playerSpawn": spawn,
+        "enemy": enemy_list,
+        "tile_info": TILE_INFO,
+        "map_info": map_info_for(codes, tilesize),
+        "entity": [],
+    }
+    return map_data, codes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=u"洞穴地图生成器")
+    parser.add_argument("--width", type=int, default=128, help=u"地图宽度（格）")
+    parser.add_argument("--height", type=int, default=96, help=u"地图高度（格）")
+    parser.add_argument("--seed", type=int, default=None, help=u"随机种子，缺省时随机")
+    parser.add_argument("--fill", type=float, default=0.45, help=u"初始墙的比例")
+    parser.add_argument("--birth", type=int, default=5, help=u"空格变墙所需的邻墙数")
+    parser.add_argument("--survive", type=int, default=4, help=u"墙保持所需的邻墙数")
+    parser.add_argument("--steps", type=int, default=5, help=u"元胞自动机迭代次数")
+    parser.add_argument("--border", type=int, default=1, help=u"外墙厚度")
+    parser.add_argument("--platforms", type=int, default=None, help=u"平台数量，缺省按面积估算")
+    parser.add_argument("--platform-length", type=int, default=4, help=u"平台长度（格）")
+    parser.add_argument("--enemies", type=int, default=10, help=u"敌人数量")
+    parser.add_argument("--tilesize", type=int, default=100, help=u"地砖像素大小")
+    parser.add_argument("--keep-pockets", action="store_true", help=u"保留封闭的小空腔")
+    parser.add_argument("--name", default="generated_cave", help=u"地图名（输出 <name>.json）")
+    parser.add_argument("--out", default=None, help=u"输出目录，缺省为脚本所在目录")
+    parser.add_argument("--codes", action="store_true", help=u"网格只写地砖 code（体积小、速度快）")
+    parser.add_argument("--start-cave", action="store_true", help=u"输出手工绘制的 start_cave")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+
+    if args.start_cave:
+        mapData, codes = build_start_cave()
+    else:
+        seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % (2 ** 32))
+        try:
+            mapData, codes = generate_cave(
+                args.width, args.height, seed=seed, fill=args.fill, birth=args.birth,
+                survive=args.survive, steps=args.steps, border=args.border,
+                platforms=args.platforms, platform_length=args.platform_length,
+                enemies=args.enemies, tilesize=args.tilesize, name=args.name,
+                keep_pockets=args.keep_pockets)
+        except ValueError as e:
+            print(u"生成失败（种子 {}）: {}".format(seed, e))
+            return 1
+        print(u"种子: {}".format(seed))
+    generated = time.perf_counter()
+
+    #下方为json打包
+
+    basepath = args.out or os.path.dirname(os.path.abspath(__file__))
+    filename = f"{mapData['name']}.json"
+    filepath = os.path.join(basepath, filename)
+    write_map(filepath, mapData, codes, CELL_CODE if args.codes else CELL_TILE)
+    done = time.perf_counter()
+
+    print(u"已生成 {} ({}x{})，生成 {:.2f}s，写出 {:.2f}s".format(
+        filepath, codes.shape[1], codes.shape[0], generated - started, done - generated))
+    return 0
+
 
-with open(filepath, "w", encoding="utf-8") as f:
-    json.dump(mapData, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
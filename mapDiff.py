@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+地图结构化对比与补丁工具
+
+    python3 mapDiff.py diff old.json new.json [-o patch.json]
+    python3 mapDiff.py apply base.json patch.json [-o out.json]
+
+配合 git 使用：git difftool -y -x "python3 mapDiff.py diff" -- start_cave.json
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from mapCache import CACHE_DIRNAME, read_map
+from mapGrid import CELL_CODE, CODE_DTYPE, OBJECT_POS_KEYS, grid_digest, label_regions, write_map
+from mapLayers import EMPTY_CODE, TERRAIN
+
+
+PATCH_FORMAT = "ionic-map-patch"
+PATCH_VERSION = 1
+
+# 合并变化区域时使用的块大小（格）
+DIFF_BLOCK = 16
+
+# 除网格与对象外，整体替换比较的顶层字段（layers 只含图层元数据，网格按 tiles 对比）
+META_KEYS = ("name", "tile_info", "map_info", "layers", "palettes")
+
+
+def read_map_file(filepath, cache_dir=None):
+    """读取地图文件（经过 mapCache 的解析缓存），返回 (地图数据, terrain 网格, {图层名: 其余图层网格}, 读取信息)
+
+    读取信息中 cell_format 为原格子写法，cached 为是否命中缓存；cache_dir 缺省为地图所在目录下的缓存目录。
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), CACHE_DIRNAME)
+    map_data, grids, info = read_map(filepath, cache_dir)
+    grids = dict(grids)
+    codes = grids.pop(TERRAIN)
+    return map_data, codes, grids, info
+
+
+def changed_mask(old_codes, new_codes):
+    """逐格比较，返回新网格形状下的变化掩码（尺寸变化时，重叠区以外全部视为变化）"""
+    mask = np.ones(new_codes.shape, dtype=bool)
+    rows = min(old_codes.shape[0], new_codes.shape[0])
+    cols = min(old_codes.shape[1], new_codes.shape[1])
+    mask[:rows, :cols] = old_codes[:rows, :cols] != new_codes[:rows, :cols]
+    return mask
+
+
+def changed_rects(mask, block=DIFF_BLOCK):
+    """把变化掩码归并为若干矩形 (x, y, w, h)，单位为格
+
+    先按块求 any，对有变化的块做连通标记，再把每个连通块收紧到实际变化的格子。
+    """
+    rows, cols = mask.shape
+    if rows == 0 or cols == 0 or not mask.any():
+        return []
+    bh = -(-rows // block)
+    bw = -(-cols // block)
+    padded = np.zeros((bh * block, bw * block), dtype=bool)
+    padded[:rows, :cols] = mask
+    blocks = padded.reshape(bh, block, bw, block).any(axis=(1, 3))
+
+    labels = label_regions(blocks)
+    by, bx = np.nonzero(blocks)
+    lab = labels[by, bx]
+    n = int(lab.max()) + 1
+    y0 = np.full(n, bh, dtype=np.int64)
+    x0 = np.full(n, bw, dtype=np.int64)
+    y1 = np.zeros(n, dtype=np.int64)
+    x1 = np.zeros(n, dtype=np.int64)
+    np.minimum.at(y0, lab, by)
+    np.minimum.at(x0, lab, bx)
+    np.maximum.at(y1, lab, by + 1)
+    np.maximum.at(x1, lab, bx + 1)
+
+    rects = []
+    for r0, c0, r1, c1 in zip(y0 * block, x0 * block, np.minimum(y1 * block, rows), np.minimum(x1 * block, cols)):
+        sub = mask[r0:r1, c0:c1]
+        ys = np.flatnonzero(sub.any(axis=1))
+        xs = np.flatnonzero(sub.any(axis=0))
+        rects.append((int(c0 + xs[0]), int(r0 + ys[0]), int(xs[-1] - xs[0] + 1), int(ys[-1] - ys[0] + 1)))
+    return rects
+
+
+def _obj_pos(obj, pos_key):
+    pos = obj.get(pos_key) or [0, 0]
+    return float(pos[0]), float(pos[1])
+
+
+def _obj_key(obj):
+    return json.dumps(obj, sort_keys=True)
+
+
+def diff_objects(old_list, new_list, pos_key):
+    """按 id 与位置匹配对象，返回 {"added", "removed", "moved"}
+
+    完全相同的对象视为未变；剩下的同 id 对象按距离就近配对为移动（其他字段的修改也归入此类）。
+    """
+    pending = {}
+    for obj in old_list or []:
+        pending.setdefault(_obj_key(obj), []).append(obj)
+    added = []
+    for obj in new_list or []:
+        same = pending.get(_obj_key(obj))
+        if same:
+            same.pop()
+        else:
+            added.append(obj)
+    old_left = [obj for objs in pending.values() for obj in objs]
+
+    moved = []
+    removed = []
+    for old in old_left:
+        ox, oy = _obj_pos(old, pos_key)
+        best = None
+        best_dist = None
+        for i, new in enumerate(added):
+            if new.get('id') != old.get('id'):
+                continue
+            nx, ny = _obj_pos(new, pos_key)
+            dist = (nx - ox) ** 2 + (ny - oy) ** 2
+            if best is None or dist < best_dist:
+                best, best_dist = i, dist
+        if best is None:
+            removed.append(old)
+        else:
+            moved.append({"from": old, "to": added.pop(best)})
+    return {"added": added, "removed": removed, "moved": moved}
+
+
+def diff_grid(old_codes, new_codes, block=DIFF_BLOCK):
+    """对比一张网格，返回 {"base", "result", "changed_cells", "tiles"}"""
+    mask = changed_mask(old_codes, new_codes)
+    tiles = []
+    for x, y, w, h in changed_rects(mask, block):
+        tiles.append({"x": x, "y": y, "w": w, "h": h, "codes": new_codes[y:y + h, x:x + w].tolist()})
+    return {
+        "base": {"shape": list(old_codes.shape), "sha1": grid_digest(old_codes)},
+        "result": {"shape": list(new_codes.shape), "sha1": grid_digest(new_codes)},
+        "changed_cells": int(mask.sum()),
+        "tiles": tiles,
+    }
+
+
+def diff_layers(old_layers, new_layers, block=DIFF_BLOCK):
+    """对比非 terrain 图层网格 {图层名: 网格}，返回 {图层名: 网格差异}
+
+    只在一侧存在的图层按另一侧为空网格对比；被删除的图层记为 {"removed": true}。
+    """
+    empty = np.zeros((0, 0), dtype=CODE_DTYPE)
+    layers = {}
+    for name in sorted(set(old_layers) | set(new_layers)):
+        if name not in new_layers:
+            layers[name] = {"removed": True}
+            continue
+        grid = diff_grid(old_layers.get(name, empty), new_layers[name], block)
+        if name not in old_layers or grid['changed_cells'] or grid['base']['shape'] != grid['result']['shape']:
+            layers[name] = grid
+    return layers
+
+
+def diff_maps(old_data, old_codes, new_data, new_codes, block=DIFF_BLOCK, old_layers=None, new_layers=None):
+    """对比两份地图（元数据 + 编码网格），返回可应用的补丁
+
+    old_layers / new_layers 为非 terrain 图层网格 {图层名: 网格}，有变化的图层记在补丁的 layers 中。
+    """
+    patch = {"format": PATCH_FORMAT, "version": PATCH_VERSION}
+    patch.update(diff_grid(old_codes, new_codes, block))
+    layers = diff_layers(old_layers or {}, new_layers or {}, block)
+    if layers:
+        patch['layers'] = layers
+    for key, pos_key in OBJECT_POS_KEYS.items():
+        objs = diff_objects(old_data.get(key), new_data.get(key), pos_key)
+        if any(objs.values()):
+            patch[key] = objs
+    if old_data.get('playerSpawn') != new_data.get('playerSpawn'):
+        patch['playerSpawn'] = {"from": old_data.get('playerSpawn'), "to": new_data.get('playerSpawn')}
+    meta = {k: new_data.get(k) for k in META_KEYS if old_data.get(k) != new_data.get(k)}
+    if meta:
+        patch['meta'] = meta
+    return patch
+
+
+def _apply_grid(codes, grid, fill=0):
+    """按网格差异 grid 返回新的网格（不修改 codes）"""
+    shape = tuple(grid['result']['shape'])
+    if codes.shape != shape:
+        resized = np.full(shape, fill, dtype=CODE_DTYPE)
+        rows = min(codes.shape[0], shape[0])
+        cols = min(codes.shape[1], shape[1])
+        resized[:rows, :cols] = codes[:rows, :cols]
+        codes = resized
+    else:
+        codes = codes.copy()
+    for t in grid.get('tiles', []):
+        block = np.asarray(t['codes'], dtype=CODE_DTYPE)
+        codes[t['y']:t['y'] + t['h'], t['x']:t['x'] + t['w']] = block
+    return codes
+
+
+def apply_patch(map_data, codes, patch, check=True, layers=None):
+    """把补丁应用到地图上：修改 map_data 中的对象，返回新的编码网格
+
+    layers 为非 terrain 图层网格 {图层名: 网格}，按补丁原地更新。
+    check 为真时要求底图与补丁记录的摘要一致。
+    """
+    if patch.get('format') != PATCH_FORMAT:
+        raise ValueError(u"不是地图补丁文件")
+    if layers is None:
+        layers = {}
+    empty = np.zeros((0, 0), dtype=CODE_DTYPE)
+    layer_ops = patch.get('layers', {})
+    if check:
+        if grid_digest(codes) != patch['base']['sha1']:
+            raise ValueError(u"底图网格与补丁不匹配")
+        for name, grid in layer_ops.items():
+            if 'base' in grid and grid_digest(layers.get(name, empty)) != grid['base']['sha1']:
+                raise ValueError(u"底图图层 {} 与补丁不匹配".format(name))
+
+    codes = _apply_grid(codes, patch)
+    updated = {}
+    for name, grid in layer_ops.items():
+        if grid.get('removed'):
+            updated[name] = None
+        else:
+            updated[name] = _apply_grid(layers.get(name, empty), grid, EMPTY_CODE)
+            if check and grid_digest(updated[name]) != grid['result']['sha1']:
+                raise ValueError(u"补丁应用后图层 {} 摘要不一致".format(name))
+
+    for key in OBJECT_POS_KEYS:
+        ops = patch.get(key)
+        if not ops:
+            continue
+        objs = map_data.setdefault(key, [])
+        for obj in ops.get('removed', []):
+            if obj in objs:
+                objs.remove(obj)
+        for move in ops.get('moved', []):
+            if move['from'] in objs:
+                objs[objs.index(move['from'])] = copy.deepcopy(move['to'])
+            else:
+                objs.append(copy.deepcopy(move['to']))
+        objs.extend(copy.deepcopy(ops.get('added', [])))
+
+    if 'playerSpawn' in patch:
+        map_data['playerSpawn'] = copy.deepcopy(patch['playerSpawn']['to'])
+    for key, value in patch.get('meta', {}).items():
+        map_data[key] = copy.deepcopy(value)
+
+    if check and grid_digest(codes) != patch['result']['sha1']:
+        raise ValueError(u"补丁应用后网格摘要不一致")
+    for name, grid in updated.items():
+        if grid is None:
+            layers.pop(name, None)
+        else:
+            layers[name] = grid
+    return codes
+
+
+def format_patch(patch):
+    """生成便于审阅的文字摘要"""
+    lines = []
+    base, result = patch['base']['shape'], patch['result']['shape']
+    if base != result:
+        lines.append(u"尺寸: {}x{} -> {}x{}".format(base[1], base[0], result[1], result[0]))
+    tiles = patch.get('tiles', [])
+    lines.append(u"地砖: {} 格变化，{} 个区域".format(patch.get('changed_cells', 0), len(tiles)))
+    for t in tiles:
+        lines.append(u"  @ x={} y={} {}x{}".format(t['x'], t['y'], t['w'], t['h']))
+    for name, grid in sorted(patch.get('layers', {}).items()):
+        if grid.get('removed'):
+            lines.append(u"图层 {}: 已删除".format(name))
+            continue
+        lines.append(u"图层 {}: {} 格变化，{} 个区域".format(name, grid['changed_cells'], len(grid['tiles'])))
+        for t in grid['tiles']:
+            lines.append(u"  @ x={} y={} {}x{}".format(t['x'], t['y'], t['w'], t['h']))
+    for key, title in (("entity", u"实体"), ("enemy", u"敌人")):
+        ops = patch.get(key)
+        if not ops:
+            continue
+        pos_key = OBJECT_POS_KEYS[key]
+        lines.append(u"{}: +{} -{} ~{}".format(title, len(ops['added']), len(ops['removed']), len(ops['moved'])))
+        for obj in ops['added']:
+            lines.append(u"  + id={} {}".format(obj.get('id'), obj.get(pos_key)))
+        for obj in ops['removed']:
+            lines.append(u"  - id={} {}".format(obj.get('id'), obj.get(pos_key)))
+        for move in ops['moved']:
+            lines.append(u"  ~ id={} {} -> {}".format(
+                move['to'].get('id'), move['from'].get(pos_key), move['to'].get(pos_key)))
+    if 'playerSpawn' in patch:
+        lines.append(u"生成点: {} -> {}".format(patch['playerSpawn']['from'], patch['playerSpawn']['to']))
+    for key in patch.get('meta', {}):
+        lines.append(u"字段 {} 已修改".format(key))
+    return u"\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=u"地图对比与补丁工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_diff = sub.add_parser("diff", help=u"对比两份地图")
+    p_diff.add_argument("old", help=u"旧地图 JSON")
+    p_diff.add_argument("new", help=u"新地图 JSON")
+    p_diff.add_argument("-o", "--output", help=u"补丁输出路径")
+    p_diff.add_argument("--block", type=int, default=DIFF_BLOCK, help=u"归并变化区域的块大小（格）")
+
+    p_apply = sub.add_parser("apply", help=u"应用补丁")
+    p_apply.add_argument("base", help=u"底图 JSON")
+    p_apply.add_argument("patch", help=u"补丁 JSON")
+    p_apply.add_argument("-o", "--output", help=u"输出路径，缺省覆盖底图")
+    p_apply.add_argument("--force", action="store_true", help=u"跳过摘要校验")
+    p_apply.add_argument("--codes", action="store_true", help=u"网格只写地砖 code（缺省沿用底图的写法）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "diff":
+        started = time.perf_counter()
+        old_data, old_codes, old_layers, old_info = read_map_file(args.old)
+        new_data, new_codes, new_layers, new_info = read_map_file(args.new)
+        loaded = time.perf_counter()
+        patch = diff_maps(old_data, old_codes, new_data, new_codes, args.block, old_layers, new_layers)
+        done = time.perf_counter()
+        print(format_patch(patch))
+        cached = sum(1 for info in (old_info, new_info) if info['cached'])
+        print(u"读取耗时 {:.3f}s（{}/2 命中缓存），对比耗时 {:.3f}s".format(loaded - started, cached, done - loaded))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(patch, f, ensure_ascii=False, separators=(',', ':'))
+        return 0
+
+    # 保持底图的格子写法（完整地砖 dict 或只写 code），--codes 时强制只写 code
+    map_data, codes, layers, info = read_map_file(args.base)
+    cell_format = CELL_CODE if args.codes else info['cell_format']
+    with open(args.patch, 'r', encoding='utf-8') as f:
+        patch = json.load(f)
+    try:
+        codes = apply_patch(map_data, codes, patch, not args.force, layers)
+    except ValueError as e:
+        print(u"应用失败: {}".format(e))
+        return 1
+    layers = {name: grid for name, grid in layers.items() if name in (map_data.get('layers') or {})}
+    write_map(args.output or args.base, map_data, codes, cell_format, layers)
+    print(u"已应用补丁: {}".format(args.output or args.base))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
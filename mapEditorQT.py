@@ -1,17 +1,61 @@
 # -*- coding: utf-8 -*-
+import copy
 import json
 import os
 import sys
+import threading
+import time
 from enum import Enum
+
+# 进程启动时刻，用于统计启动耗时
+STARTED_AT = time.perf_counter()
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QSpinBox, QComboBox, QCheckBox, QScrollArea,
-    QFrame, QGridLayout, QFileDialog, QMessageBox, QStatusBar
+    QFrame, QGridLayout, QFileDialog, QMessageBox, QStatusBar, QInputDialog,
+    QDockWidget, QListWidget, QListWidgetItem, QPlainTextEdit
 )
 from PyQt6.QtGui import (
-    QColor, QPainter, QPen, QBrush, QFont, QKeySequence
+    QColor, QPainter, QPen, QBrush, QFont, QKeySequence, QImage, QPixmap, QShortcut, qRgba
 )
-from PyQt6.QtCore import Qt, QRect, QPoint, QSize
+from PyQt6.QtCore import Qt, QRect, QPoint, QSize, QTimer, QFileSystemWatcher, pyqtSignal
+
+import numpy as np
+
+from mapCache import CACHE_DIRNAME, read_map, store_cache
+from mapDiff import changed_mask, diff_maps, format_patch, read_map_file
+from mapGrid import CELL_TILE, OBJECT_POS_KEYS, TILE_PX, map_tilesize, write_map
+from mapLayers import (
+    BACKGROUND, COLLISION, EMPTY_CODE, FOREGROUND, LAYER_NAMES, TERRAIN, TILE_DEFAULT_COLOR,
+    build_layers, layer_rgba, palette_for, prepare_for_write, refresh_collision
+)
+from mapLive import LIVE_HOST, LIVE_PORT, OBJECT_KINDS, DeltaBuffer, LiveServer
+from mapScript import MapScript, run_script
+from mapValidator import ERROR, format_issue, validate_map
+from mapWatch import field_digests, grid_digests, map_digests, plan_reload
+from mapStamps import (
+    clear_region, copy_region, load_stamps, paste_region, restore, save_stamps, snapshot
+)
+
+
+# 撤销记录的最大条数
+UNDO_LIMIT = 50
+
+# 图层显示名称
+LAYER_TITLES = {BACKGROUND: u"背景", TERRAIN: u"地形", FOREGROUND: u"前景", COLLISION: u"碰撞"}
+
+# 单个图层栅格最多区分的 code 数（Indexed8）
+RASTER_COLORS = 256
+
+# 平移/缩放停止多久后重新完整绘制（毫秒，可在配置 view.settle_delay_ms 中修改）
+SETTLE_DELAY_MS = 150
+
+# 实时推送的合并周期（毫秒）：一帧内的修改合并为一条消息
+LIVE_FRAME_MS = 16
+
+# 地图文件变化后等待多久再重新读取（毫秒，等外部工具写完；可在配置 watch.debounce_ms 中修改）
+WATCH_DEBOUNCE_MS = 300
 
 
 class EditMode(Enum):
@@ -20,6 +64,7 @@ class EditMode(Enum):
     ENTITY = 2
     SPAWN = 3
     ENEMY = 4
+    SELECT = 5
 
 
 class MapCanvas(QWidget):
@@ -30,17 +75,81 @@ class MapCanvas(QWidget):
         self.editor = editor
         self.setMouseTracking(True)
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        # 各图层的栅格缓存 {图层名: (索引缓冲, code->索引 查找表, QImage)}，每格 1 像素
+        self.layer_rasters = {}
+        
+        # 上一次完整绘制的画面及其视图 (zoom, offset_x, offset_y)；
+        # 拖动/滚轮期间只对它做平移缩放贴图，停止操作后再完整绘制
+        self.frame = None
+        self.frame_view = None
+        self.interacting = False
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.timeout.connect(self.end_interaction)
     
     def paintEvent(self, event):
         """绘制事件"""
         painter = QPainter(self)
-        painter.fillRect(self.rect(), QColor(30, 30, 30))
         
         if self.editor.map_data is None:
+            painter.fillRect(self.rect(), QColor(30, 30, 30))
+            self.draw_placeholder(painter)
             return
         
-        # 绘制地图
-        self.draw_map(painter)
+        if self.interacting and self.frame is not None:
+            self.draw_transformed_frame(painter)
+            return
+        
+        # 完整绘制到缓存画面（只重绘需要更新的区域），再贴到窗口上
+        rect = event.rect()
+        if self.ensure_frame():
+            rect = self.rect()
+        frame_painter = QPainter(self.frame)
+        frame_painter.setClipRect(rect)
+        self.draw_scene(frame_painter, rect)
+        frame_painter.end()
+        self.frame_view = (self.editor.zoom, self.editor.offset_x, self.editor.offset_y)
+        painter.setClipRect(rect)
+        painter.drawPixmap(0, 0, self.frame)
+    
+    def ensure_frame(self):
+        """准备与画布同尺寸的缓存画面，新建时返回 True（需要整幅绘制）"""
+        ratio = self.devicePixelRatioF()
+        size = QSize(int(self.width() * ratio), int(self.height() * ratio))
+        if self.frame is not None and self.frame.size() == size:
+            return False
+        self.frame = QPixmap(size)
+        self.frame.setDevicePixelRatio(ratio)
+        return True
+    
+    def draw_transformed_frame(self, painter):
+        """交互期间：把上一帧按当前视图与绘制时视图之差平移缩放后贴出，不重新绘制地图"""
+        zoom, offset_x, offset_y = self.frame_view
+        scale = self.editor.zoom / zoom
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        painter.translate(self.editor.offset_x - offset_x * scale, self.editor.offset_y - offset_y * scale)
+        painter.scale(scale, scale)
+        painter.drawPixmap(0, 0, self.frame)
+    
+    def interact(self):
+        """平移/缩放的每个输入事件：只刷新变换后的上一帧，并推迟完整绘制"""
+        if self.frame_view is not None:
+            self.interacting = True
+        delay = (self.editor.config or {}).get('view', {}).get('settle_delay_ms', SETTLE_DELAY_MS)
+        self.settle_timer.start(int(delay))
+        self.update()
+    
+    def end_interaction(self):
+        """输入停止：按当前视图完整重绘，并保存视图状态"""
+        self.interacting = False
+        self.update()
+        self.editor.update_status()
+        self.editor.save_last_state()
+    
+    def draw_scene(self, painter, rect):
+        """完整绘制地图与各类标记"""
+        painter.fillRect(rect, QColor(30, 30, 30))
+        self.draw_map(painter, rect)
         
         # 绘制其他元素
         if self.editor.show_spawn:
@@ -49,42 +158,123 @@ class MapCanvas(QWidget):
             self.draw_entities(painter)
         if self.editor.show_enemies:
             self.draw_enemies(painter)
+        if self.editor.show_diff and self.editor.diff_patch is not None:
+            self.draw_diff(painter, rect)
+        if self.editor.selection is not None:
+            self.draw_selection(painter)
+        if self.editor.reload_conflicts is not None:
+            self.draw_conflicts(painter)
+    
+    def draw_placeholder(self, painter):
+        """尚无地图时的占位画面；首次绘制后再开始加载上次的地图"""
+        painter.setPen(QColor(160, 160, 160))
+        painter.setFont(QFont("Monaco", 14))
+        if self.editor.startup_pending:
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, u"正在加载地图...")
+            self.editor.startup_pending = False
+            self.editor.startup_times['first_paint'] = time.perf_counter() - STARTED_AT
+            QTimer.singleShot(0, self.editor.finish_startup)
+        else:
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, u"未打开地图")
+    
+    def visible_range(self, rows, cols, rect=None):
+        """rect（缺省为整个画布）内可见的格子范围 (r0, r1, c0, c1)"""
+        rect = rect or self.rect()
+        tile_size = max(1, int(40 * self.editor.zoom))
+        c0 = max(0, int((rect.left() - self.editor.offset_x) // tile_size))
+        r0 = max(0, int((rect.top() - self.editor.offset_y) // tile_size))
+        c1 = min(cols, int((rect.right() + 1 - self.editor.offset_x) // tile_size) + 1)
+        r1 = min(rows, int((rect.bottom() + 1 - self.editor.offset_y) // tile_size) + 1)
+        return r0, max(r0, r1), c0, max(c0, c1)
+    
+    def build_raster(self, name):
+        """把图层网格转为 Indexed8 图像：每格 1 像素，颜色表由图层中出现的 code 决定"""
+        codes = self.editor.layers[name].codes
+        rows, cols = codes.shape
+        present = np.flatnonzero(np.bincount(codes.ravel(), minlength=1)) if codes.size else np.zeros(0, np.int64)
+        lut = np.full(max(int(present[-1]) + 1 if present.size else 1, 1), RASTER_COLORS - 1, dtype=np.uint8)
+        kept = present[:RASTER_COLORS - 1]
+        lut[kept] = np.arange(kept.size, dtype=np.uint8)
+        table = [qRgba(*layer_rgba(name, int(code))) for code in kept]
+        # 超出的 code 共用最后一个索引
+        table += [qRgba(*TILE_DEFAULT_COLOR, 255)] * (RASTER_COLORS - len(table))
+        
+        # 每行按 4 字节对齐，QImage 直接引用 numpy 缓冲
+        stride = (cols + 3) // 4 * 4
+        buf = np.zeros((rows, stride), dtype=np.uint8)
+        buf[:, :cols] = lut[codes]
+        image = QImage(buf.data, cols, rows, stride, QImage.Format.Format_Indexed8)
+        image.setColorTable(table)
+        self.layer_rasters[name] = (buf, lut, image)
+    
+    def invalidate_layer(self, name=None, cells=None):
+        """图层内容变化后更新栅格缓存
+        
+        name 为空时丢弃全部图层；cells=(r0, c0, r1, c1) 时只重写这部分像素并重绘对应区域，
+        其余图层的栅格不受影响。
+        """
+        if name is None:
+            self.layer_rasters.clear()
+            self.update()
+            return
+        cached = self.layer_rasters.get(name)
+        if cached is None or cells is None:
+            self.layer_rasters.pop(name, None)
+            self.update()
+            return
+        buf, lut, _ = cached
+        r0, c0, r1, c1 = cells
+        block = self.editor.layers[name].codes[r0:r1, c0:c1]
+        # 出现新 code 时颜色表需要重建
+        if block.size and (int(block.max()) >= lut.size or (lut[block] == RASTER_COLORS - 1).any()):
+            self.layer_rasters.pop(name, None)
+            self.update()
+            return
+        buf[r0:r1, c0:c1] = lut[block]
+        self.update(self.cells_rect(r0, c0, r1, c1))
     
-    def draw_map(self, painter):
-        """绘制地图网格"""
-        map_grid = self.editor.map_data.get('map', [])
+    def draw_map(self, painter, rect=None):
+        """按自下而上的顺序合成可见图层（只绘制 rect 内可见的格子）
+        
+        每个图层的栅格各自缓存，这里只做缩放贴图；切换显示或透明度不需要重新栅格化。
+        """
+        codes = self.editor.codes
         tile_size = int(40 * self.editor.zoom)
+        r0, r1, c0, c1 = self.visible_range(codes.shape[0], codes.shape[1], rect)
+        if r0 >= r1 or c0 >= c1:
+            return
         
-        for row in range(len(map_grid)):
-            for col in range(len(map_grid[row])):
-                tile = map_grid[row][col]
-                x = col * tile_size + self.editor.offset_x
-                y = row * tile_size + self.editor.offset_y
-                
-                if isinstance(tile, dict):
-                    tile_code = tile.get('code', 1)
-                else:
-                    tile_code = tile
-                
-                if tile_code == 1:
-                    color = QColor(80, 80, 80)
-                elif tile_code == 2:
-                    color = QColor(150, 150, 150)
-                else:
-                    color = QColor(120, 120, 120)
-                
-                painter.fillRect(int(x), int(y), int(tile_size), int(tile_size), color)
-                
-                if self.editor.show_grid:
-                    painter.drawRect(int(x), int(y), int(tile_size), int(tile_size))
+        x0 = int(c0 * tile_size + self.editor.offset_x)
+        y0 = int(r0 * tile_size + self.editor.offset_y)
+        target = QRect(x0, y0, (c1 - c0) * tile_size, (r1 - r0) * tile_size)
+        source = QRect(c0, r0, c1 - c0, r1 - r0)
+        for name in LAYER_NAMES:
+            layer = self.editor.layers[name]
+            if not layer.visible or layer.opacity <= 0:
+                continue
+            if name not in self.layer_rasters:
+                self.build_raster(name)
+            painter.setOpacity(layer.opacity)
+            painter.drawImage(target, self.layer_rasters[name][2], source)
+        painter.setOpacity(1.0)
+        
+        if self.editor.show_grid:
+            painter.setPen(QColor(0, 0, 0))
+            for col in range(c0, c1 + 1):
+                x = x0 + (col - c0) * tile_size
+                painter.drawLine(x, target.top(), x, target.bottom() + 1)
+            for row in range(r0, r1 + 1):
+                y = y0 + (row - r0) * tile_size
+                painter.drawLine(target.left(), y, target.right() + 1, y)
     
     def draw_entities(self, painter):
         """绘制实体"""
         entities = self.editor.map_data.get('entity', [])
+        scale = self.editor.object_scale()
         for entity in entities:
             x, y = entity['position']
-            screen_x = x * self.editor.zoom + self.editor.offset_x
-            screen_y = y * self.editor.zoom + self.editor.offset_y
+            screen_x = x * scale + self.editor.offset_x
+            screen_y = y * scale + self.editor.offset_y
             
             color = QColor(0, 255, 0) if entity == self.editor.selected_entity else QColor(0, 200, 0)
             painter.setBrush(QBrush(color))
@@ -96,10 +286,11 @@ class MapCanvas(QWidget):
     def draw_enemies(self, painter):
         """绘制敌人"""
         enemies = self.editor.map_data.get('enemy', [])
+        scale = self.editor.object_scale()
         for enemy in enemies:
             x, y = enemy['spawn']
-            screen_x = x * self.editor.zoom + self.editor.offset_x
-            screen_y = y * self.editor.zoom + self.editor.offset_y
+            screen_x = x * scale + self.editor.offset_x
+            screen_y = y * scale + self.editor.offset_y
             
             color = QColor(255, 0, 0) if enemy == self.editor.selected_enemy else QColor(200, 0, 0)
             points = [
@@ -113,12 +304,101 @@ class MapCanvas(QWidget):
             painter.setPen(QPen(QColor(255, 255, 255), 2))
             painter.drawPolygon(points)
     
+    def draw_diff(self, painter, rect=None):
+        """绘制与对比地图之间的差异：变化格子、变化区域外框、对象的增删与移动"""
+        zoom = self.editor.zoom
+        ox, oy = self.editor.offset_x, self.editor.offset_y
+        tile_size = int(40 * zoom)
+        mask = self.editor.diff_mask
+        
+        painter.setPen(Qt.PenStyle.NoPen)
+        r0, r1, c0, c1 = self.visible_range(mask.shape[0], mask.shape[1], rect)
+        ys, xs = mask[r0:r1, c0:c1].nonzero()
+        fill = QColor(255, 200, 0, 110)
+        for r, c in zip((ys + r0).tolist(), (xs + c0).tolist()):
+            painter.fillRect(int(c * tile_size + ox), int(r * tile_size + oy), tile_size, tile_size, fill)
+        
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.setPen(QPen(QColor(255, 200, 0), 2))
+        for t in self.editor.diff_patch.get('tiles', []):
+            painter.drawRect(int(t['x'] * tile_size + ox), int(t['y'] * tile_size + oy),
+                             int(t['w'] * tile_size), int(t['h'] * tile_size))
+        painter.setPen(QPen(QColor(0, 200, 255), 2, Qt.PenStyle.DashLine))
+        for grid in self.editor.diff_patch.get('layers', {}).values():
+            for t in grid.get('tiles', []):
+                painter.drawRect(int(t['x'] * tile_size + ox), int(t['y'] * tile_size + oy),
+                                 int(t['w'] * tile_size), int(t['h'] * tile_size))
+        
+        scale = self.editor.object_scale()
+        for key, pos_key in OBJECT_POS_KEYS.items():
+            ops = self.editor.diff_patch.get(key)
+            if not ops:
+                continue
+            painter.setPen(QPen(QColor(255, 80, 80), 2))
+            for obj in ops['removed']:
+                x, y = obj[pos_key]
+                sx, sy = int(x * scale + ox), int(y * scale + oy)
+                painter.drawLine(sx - 10, sy - 10, sx + 10, sy + 10)
+                painter.drawLine(sx - 10, sy + 10, sx + 10, sy - 10)
+            painter.setPen(QPen(QColor(255, 200, 0), 2, Qt.PenStyle.DashLine))
+            for move in ops['moved']:
+                fx, fy = move['from'][pos_key]
+                tx, ty = move['to'][pos_key]
+                painter.drawLine(int(fx * scale + ox), int(fy * scale + oy), int(tx * scale + ox), int(ty * scale + oy))
+            painter.setPen(QPen(QColor(80, 255, 80), 2))
+            for obj in ops['added']:
+                x, y = obj[pos_key]
+                painter.drawEllipse(int(x * scale + ox) - 20, int(y * scale + oy) - 20, 40, 40)
+    
+    def draw_selection(self, painter):
+        """绘制选区虚线框"""
+        r0, c0, r1, c1 = self.editor.selection
+        tile_size = int(40 * self.editor.zoom)
+        painter.setBrush(QBrush(QColor(80, 160, 255, 50)))
+        painter.setPen(QPen(QColor(80, 160, 255), 2, Qt.PenStyle.DashLine))
+        painter.drawRect(int(c0 * tile_size + self.editor.offset_x), int(r0 * tile_size + self.editor.offset_y),
+                         int((c1 - c0) * tile_size), int((r1 - r0) * tile_size))
+    
+    def draw_conflicts(self, painter):
+        """标出与外部修改冲突、保留了本地内容的格子"""
+        tile_size = int(40 * self.editor.zoom)
+        ox, oy = self.editor.offset_x, self.editor.offset_y
+        painter.setPen(Qt.PenStyle.NoPen)
+        fill = QColor(255, 60, 60, 90)
+        for items in self.editor.reload_conflicts.conflicts.values():
+            for (r0, c0, r1, c1), mask in items:
+                ys, xs = mask.nonzero()
+                for r, c in zip((ys + r0).tolist(), (xs + c0).tolist()):
+                    painter.fillRect(int(c * tile_size + ox), int(r * tile_size + oy), tile_size, tile_size, fill)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.setPen(QPen(QColor(255, 60, 60), 2, Qt.PenStyle.DashLine))
+        for items in self.editor.reload_conflicts.conflicts.values():
+            for (r0, c0, r1, c1), mask in items:
+                ys, xs = mask.nonzero()
+                painter.drawRect(int((c0 + xs.min()) * tile_size + ox), int((r0 + ys.min()) * tile_size + oy),
+                                 int((xs.max() - xs.min() + 1) * tile_size), int((ys.max() - ys.min() + 1) * tile_size))
+    
+    def cells_rect(self, r0, c0, r1, c1, margin=20):
+        """格子范围对应的屏幕矩形（外扩 margin 以覆盖对象标记）"""
+        tile_size = int(40 * self.editor.zoom)
+        return QRect(int(c0 * tile_size + self.editor.offset_x) - margin,
+                     int(r0 * tile_size + self.editor.offset_y) - margin,
+                     int((c1 - c0) * tile_size) + 2 * margin,
+                     int((r1 - r0) * tile_size) + 2 * margin)
+    
+    def cell_at(self, pos):
+        """屏幕坐标对应的格子 (row, col)"""
+        tile_size = int(40 * self.editor.zoom)
+        return (int((pos.y() - self.editor.offset_y) // tile_size),
+                int((pos.x() - self.editor.offset_x) // tile_size))
+    
     def draw_spawn(self, painter):
         """绘制玩家生成点"""
         spawn = self.editor.map_data.get('playerSpawn', {})
         x, y = spawn.get('x', 0), spawn.get('y', 0)
-        screen_x = x * self.editor.zoom + self.editor.offset_x
-        screen_y = y * self.editor.zoom + self.editor.offset_y
+        scale = self.editor.object_scale()
+        screen_x = x * scale + self.editor.offset_x
+        screen_y = y * scale + self.editor.offset_y
         
         painter.fillRect(int(screen_x) - 15, int(screen_y) - 15, 30, 30, QColor(0, 0, 255))
         painter.setPen(QPen(QColor(255, 255, 255), 2))
@@ -139,32 +419,51 @@ class MapCanvas(QWidget):
             if self.editor.edit_mode == EditMode.TILE:
                 grid_x = int(world_x)
                 grid_y = int(world_y)
+                # 只重绘改动的格子（见 set_tile_at）
                 self.editor.set_tile_at(grid_y, grid_x, self.editor.selected_tile_id)
+                return
             elif self.editor.edit_mode == EditMode.ENTITY:
-                self.editor.add_or_select_entity(world_x * 40, world_y * 40)
+                tilesize = map_tilesize(self.editor.map_data)
+                self.editor.add_or_select_entity(world_x * tilesize, world_y * tilesize)
             elif self.editor.edit_mode == EditMode.SPAWN:
-                self.editor.set_player_spawn(world_x * 40, world_y * 40)
+                tilesize = map_tilesize(self.editor.map_data)
+                self.editor.set_player_spawn(world_x * tilesize, world_y * tilesize)
             elif self.editor.edit_mode == EditMode.ENEMY:
-                self.editor.add_or_select_enemy(world_x * 40, world_y * 40)
+                tilesize = map_tilesize(self.editor.map_data)
+                self.editor.add_or_select_enemy(world_x * tilesize, world_y * tilesize)
+            elif self.editor.edit_mode == EditMode.SELECT:
+                self.select_anchor = self.cell_at(event.pos())
+                self.editor.set_selection(self.select_anchor, self.select_anchor)
             self.update()
         
         elif event.button() == Qt.MouseButton.RightButton:
             grid_x = int(world_x)
             grid_y = int(world_y)
-            self.editor.set_tile_at(grid_y, grid_x, 1)
-            self.update()
+            self.editor.erase_tile_at(grid_y, grid_x)
     
     def mouseMoveEvent(self, event):
         """鼠标移动事件"""
-        if event.buttons() == Qt.MouseButton.MiddleButton:
+        self.hover_cell = self.cell_at(event.pos())
+        if event.buttons() == Qt.MouseButton.LeftButton and self.editor.edit_mode == EditMode.SELECT:
+            if getattr(self, 'select_anchor', None) is not None:
+                self.editor.set_selection(self.select_anchor, self.hover_cell)
+                self.update()
+        elif event.buttons() == Qt.MouseButton.MiddleButton:
             if hasattr(self, 'last_pos'):
                 delta = event.pos() - self.last_pos
                 self.editor.offset_x += delta.x()
                 self.editor.offset_y += delta.y()
-                self.update()
-                self.editor.save_last_state()
+                self.interact()
             self.last_pos = event.pos()
     
+    def mouseReleaseEvent(self, event):
+        """鼠标释放事件"""
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.select_anchor = None
+        elif event.button() == Qt.MouseButton.MiddleButton and hasattr(self, 'last_pos'):
+            # 下一次拖动从按下处重新计算位移
+            del self.last_pos
+    
     def wheelEvent(self, event):
         """鼠标滚轮事件"""
         delta = event.angleDelta().y()
@@ -198,21 +497,35 @@ class MapCanvas(QWidget):
         self.editor.offset_x = px - world_x * tile_size * new_zoom
         self.editor.offset_y = py - world_y * tile_size * new_zoom
 
+        # 只同步显示，不触发 on_zoom_changed 的整幅重绘
+        self.editor.zoom_spin.blockSignals(True)
         self.editor.zoom_spin.setValue(int(new_zoom * 100))
-        self.update()
-        self.editor.update_status()
-        self.editor.save_last_state()
+        self.editor.zoom_spin.blockSignals(False)
+        self.interact()
 
 
 class MapEditorQt(QMainWindow):
     """基于 PyQt6 的地图编辑器"""
     
+    # 后台地图检查完成：(检查序号, 问题列表)
+    validation_finished = pyqtSignal(int, object)
+    # 与文件同步时的内容摘要计算完成：(序号, 摘要)
+    digests_ready = pyqtSignal(int, object)
+    # 外部修改后的文件读取完成：(序号, 读取结果；读取失败时为 None)
+    reload_ready = pyqtSignal(int, object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle(u"mapEditor - Qt6")
         self.setGeometry(100, 100, 1600, 1000)
         
-        # 地图数据        self.map_data = None
+        # 地图数据（map 字段以编码网格 codes 保存，codes 即 terrain 图层）
+        self.map_data = None
+        self.codes = None
+        self.layers = {}
+        self.active_layer = TERRAIN
+        self.cell_format = CELL_TILE
+        self.load_info = {}
         self.current_map_name = None
         self.basepath = os.path.dirname(os.path.abspath(__file__))
         
@@ -223,21 +536,65 @@ class MapEditorQt(QMainWindow):
         self.offset_x = 0
         self.offset_y = 0
 
-        # 配置与持久化
+        # 配置与持久化（配置与上次的地图在首次绘制后再读取，见 finish_startup）
         self.config = None
         self.config_path = os.path.join(self.basepath, "map_editor_config.json")
-        self.load_config()
+        self.cache_dir = os.path.join(self.basepath, CACHE_DIRNAME)
+        
+        # 启动状态与耗时统计（秒，自进程启动起算）
+        self.startup_pending = True
+        self.startup_times = {}
+        self.exit_after_startup = False
         
         # UI 状态
         self.show_grid = True
         self.show_entities = True
         self.show_enemies = True
         self.show_spawn = True
+        self.show_diff = True
+        
+        # 与其他版本对比的结果（补丁 + 变化格子掩码）
+        self.diff_patch = None
+        self.diff_mask = None
         
         # 选中的对象
         self.selected_entity = None
         self.selected_enemy = None
         
+        # 选区 (r0, c0, r1, c1)、剪贴板、图章库与撤销记录
+        self.selection = None
+        self.clipboard = None
+        self.undo_stack = []
+        # 自上次加载或保存以来是否有未保存的修改（不是所有修改都进入撤销记录）
+        self.dirty = False
+        self.stamps_path = os.path.join(self.basepath, "map_stamps.json")
+        self.stamps = self.load_stamp_library()
+        
+        # 后台地图检查
+        self.validation_serial = 0
+        self.validation_issues = []
+        self.validation_finished.connect(self.on_validation_finished)
+        
+        # 实时推送到游戏（见 mapLive）
+        self.live_server = None
+        self.live_delta = DeltaBuffer()
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(LIVE_FRAME_MS)
+        self.live_timer.timeout.connect(self.flush_live)
+        
+        # 监视打开的地图文件，外部修改时增量重新加载（见 mapWatch）
+        self.disk_digests = None
+        self.digest_serial = 0
+        self.reload_serial = 0
+        self.reload_conflicts = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.timeout.connect(self.start_reload)
+        self.digests_ready.connect(self.on_digests_ready)
+        self.reload_ready.connect(self.on_reload_ready)
+        
         # 初始化 UI
         self.init_ui()
     
@@ -257,9 +614,54 @@ class MapEditorQt(QMainWindow):
         right_panel = self.create_right_panel()
         main_layout.addWidget(right_panel, 0)
         
+        # 底部：地图检查结果
+        self.issue_list = QListWidget()
+        self.issue_list.itemClicked.connect(self.on_issue_clicked)
+        issue_dock = QDockWidget(u"地图检查", self)
+        issue_dock.setObjectName("issue_dock")
+        issue_dock.setWidget(self.issue_list)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, issue_dock)
+        
+        # 底部：脚本控制台（与地图检查叠放为标签页）
+        script_dock = QDockWidget(u"脚本控制台", self)
+        script_dock.setObjectName("script_dock")
+        script_dock.setWidget(self.create_script_console())
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, script_dock)
+        self.tabifyDockWidget(issue_dock, script_dock)
+        issue_dock.raise_()
+        
         # 状态栏
         self.statusBar().showMessage(u"准备就绪")
     
+    def create_script_console(self):
+        """脚本控制台：输入区、运行按钮与输出区（脚本中可用 m 与 np，见 mapScript）"""
+        console = QWidget()
+        layout = QVBoxLayout(console)
+        
+        self.script_edit = QPlainTextEdit()
+        self.script_edit.setFont(QFont("Monaco", 10))
+        self.script_edit.setPlaceholderText(u"# 例：m.replace(2, 3, rect=(0, 0, 20, 40))    Ctrl+Enter 运行")
+        layout.addWidget(self.script_edit, 2)
+        shortcut = QShortcut(QKeySequence("Ctrl+Return"), self.script_edit)
+        shortcut.setContext(Qt.ShortcutContext.WidgetShortcut)
+        shortcut.activated.connect(self.run_console_script)
+        
+        btn_layout = QHBoxLayout()
+        run_btn = QPushButton(u"运行")
+        run_btn.clicked.connect(self.run_console_script)
+        btn_layout.addWidget(run_btn)
+        open_btn = QPushButton(u"运行脚本文件...")
+        open_btn.clicked.connect(self.run_script_dialog)
+        btn_layout.addWidget(open_btn)
+        btn_layout.addStretch()
+        layout.addLayout(btn_layout)
+        
+        self.script_output = QPlainTextEdit()
+        self.script_output.setReadOnly(True)
+        self.script_output.setFont(QFont("Monaco", 9))
+        layout.addWidget(self.script_output, 1)
+        return console
+    
     def create_right_panel(self):
         """创建右侧工具栏"""
         panel = QFrame()
@@ -277,18 +679,42 @@ class MapEditorQt(QMainWindow):
         save_btn.clicked.connect(self.save_map)
         layout.addWidget(save_btn)
         
+        diff_btn = QPushButton(u"对比地图...")
+        diff_btn.clicked.connect(self.diff_map_dialog)
+        layout.addWidget(diff_btn)
+        
+        clear_diff_btn = QPushButton(u"清除对比")
+        clear_diff_btn.clicked.connect(self.clear_diff)
+        layout.addWidget(clear_diff_btn)
+        
+        self.live_check = QCheckBox(u"实时推送到游戏")
+        self.live_check.toggled.connect(self.toggle_live)
+        layout.addWidget(self.live_check)
+        
         layout.addSpacing(20)
         
         # 编辑模式选择
         layout.addWidget(QLabel(u"<b>编辑模式</b>"))
         
         self.mode_combo = QComboBox()
-        self.mode_combo.addItems([u"地砖编辑", u"实体编辑", u"生成点编辑", u"敌人编辑"])
+        self.mode_combo.addItems([u"地砖编辑", u"实体编辑", u"生成点编辑", u"敌人编辑", u"选区编辑"])
         self.mode_combo.currentIndexChanged.connect(self.on_mode_changed)
         layout.addWidget(self.mode_combo)
         
         layout.addSpacing(20)
         
+        # 编辑图层
+        layout.addWidget(QLabel(u"<b>编辑图层</b>"))
+        
+        self.layer_combo = QComboBox()
+        for name in LAYER_NAMES:
+            self.layer_combo.addItem(LAYER_TITLES[name], name)
+        self.layer_combo.setCurrentIndex(LAYER_NAMES.index(TERRAIN))
+        self.layer_combo.currentIndexChanged.connect(self.on_layer_changed)
+        layout.addWidget(self.layer_combo)
+        
+        layout.addSpacing(20)
+        
         # 地砖选择
         layout.addWidget(QLabel(u"<b>地砖选择</b>"))
         
@@ -298,6 +724,32 @@ class MapEditorQt(QMainWindow):
         
         layout.addSpacing(20)
         
+        # 选区与图章
+        layout.addWidget(QLabel(u"<b>选区与图章</b>"))
+        
+        clip_layout = QHBoxLayout()
+        for text, slot in ((u"复制", self.copy_selection), (u"剪切", self.cut_selection), (u"粘贴", self.paste_clipboard)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            clip_layout.addWidget(btn)
+        layout.addLayout(clip_layout)
+        
+        self.stamp_combo = QComboBox()
+        self.stamp_combo.activated.connect(self.on_stamp_chosen)
+        layout.addWidget(self.stamp_combo)
+        self.refresh_stamp_combo()
+        
+        stamp_layout = QHBoxLayout()
+        save_stamp_btn = QPushButton(u"存为图章")
+        save_stamp_btn.clicked.connect(self.save_stamp)
+        stamp_layout.addWidget(save_stamp_btn)
+        del_stamp_btn = QPushButton(u"删除图章")
+        del_stamp_btn.clicked.connect(self.delete_stamp)
+        stamp_layout.addWidget(del_stamp_btn)
+        layout.addLayout(stamp_layout)
+        
+        layout.addSpacing(20)
+        
         # 显示选项
         layout.addWidget(QLabel(u"<b>显示选项</b>"))
         
@@ -321,6 +773,28 @@ class MapEditorQt(QMainWindow):
         self.spawn_check.stateChanged.connect(lambda: setattr(self, 'show_spawn', self.spawn_check.isChecked()) or self.canvas.update())
         layout.addWidget(self.spawn_check)
         
+        self.diff_check = QCheckBox(u"显示差异")
+        self.diff_check.setChecked(True)
+        self.diff_check.stateChanged.connect(lambda: setattr(self, 'show_diff', self.diff_check.isChecked()) or self.canvas.update())
+        layout.addWidget(self.diff_check)
+        
+        # 各图层的显示开关与不透明度
+        self.layer_checks = {}
+        self.layer_opacity_spins = {}
+        layer_grid = QGridLayout()
+        for i, name in enumerate(reversed(LAYER_NAMES)):
+            check = QCheckBox(u"显示{}层".format(LAYER_TITLES[name]))
+            check.stateChanged.connect(lambda _, n=name: self.on_layer_visibility_changed(n))
+            spin = QSpinBox()
+            spin.setRange(0, 100)
+            spin.setSuffix("%")
+            spin.valueChanged.connect(lambda _, n=name: self.on_layer_opacity_changed(n))
+            layer_grid.addWidget(check, i, 0)
+            layer_grid.addWidget(spin, i, 1)
+            self.layer_checks[name] = check
+            self.layer_opacity_spins[name] = spin
+        layout.addLayout(layer_grid)
+        
         layout.addSpacing(20)
         
         # 缩放控制
@@ -355,6 +829,9 @@ class MapEditorQt(QMainWindow):
 滚轮：缩放
 Delete/Backspace：删除选中对象
 R：重置视图
+5：选区编辑（左键拖动框选）
+Ctrl+C/X/V：复制/剪切/粘贴到光标处
+Ctrl+Z：撤销
         """
         
         shortcuts_label = QLabel(shortcuts_text)
@@ -374,6 +851,8 @@ R：重置视图
     
     def load_map(self, map_name=None):
         """加载地图文件"""
+        if self.config is None:
+            self.load_config()
         if not map_name:
             map_name = self.config.get('last_map')
         if map_name is None:
@@ -385,18 +864,34 @@ R：重置视图
             return False
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self.map_data = json.load(f)
-                self.current_map_name = map_name
-                self.update_ui()
-                # 视图定位：优先恢复上次视图，否则居中
-                if self.config.get('persist', {}).get('remember_last_view') and self.config.get('last_state'):
-                    self.apply_last_view()
-                else:
-                    self.center_view()
-                self.canvas.update()
-                self.statusBar().showMessage(u"地图已加载: {}".format(map_name))
-                return True
+            self.map_data, grids, self.load_info = read_map(filepath, self.cache_dir)
+            self.layers, self.load_info['layer_mismatch'] = build_layers(self.map_data, grids)
+            self.codes = self.layers[TERRAIN].codes
+            self.canvas.invalidate_layer()
+            self.cell_format = self.load_info['cell_format']
+            cached = self.last_load_cached = self.load_info['cached']
+            self.current_map_name = map_name
+            self.diff_patch = None
+            self.diff_mask = None
+            self.selection = None
+            self.undo_stack = []
+            self.dirty = False
+            self.reload_conflicts = None
+            self.watch_map_file(filepath)
+            self.refresh_disk_digests(grids)
+            if self.live_server is not None:
+                self.live_delta.clear()
+                self.live_server.resync_all()
+            self.update_ui()
+            # 视图定位：优先恢复上次视图，否则居中
+            if self.config.get('persist', {}).get('remember_last_view') and self.config.get('last_state'):
+                self.apply_last_view()
+            else:
+                self.center_view()
+            self.canvas.update()
+            self.statusBar().showMessage(u"地图已加载: {}{}".format(map_name, u"（缓存）" if cached else u""))
+            self.run_validation()
+            return True
         except Exception as e:
             QMessageBox.critical(self, u"错误", u"加载地图失败: {}".format(e))
             return False
@@ -409,10 +904,22 @@ R：重置视图
         
         filepath = os.path.join(self.basepath, u"{}.json".format(self.current_map_name))
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.map_data, f, ensure_ascii=False, indent=2)
-                self.statusBar().showMessage(u"地图已保存: {}".format(self.current_map_name))
-                return True
+            extra = prepare_for_write(self.map_data, self.layers)
+            write_map(filepath, self.map_data, self.codes, self.cell_format, extra)
+            # 写出的每一行都是完整的，参差行已不存在
+            self.load_info = {"cell_format": self.cell_format, "ragged": [], "layer_mismatch": []}
+            grids = dict(extra)
+            grids[TERRAIN] = self.codes
+            store_cache(filepath, self.cache_dir, self.map_data, grids, self.load_info)
+            # 保存覆盖了磁盘上的版本，冲突随之解决；保存时的原子替换也需要重新监视
+            self.dirty = False
+            self.reload_conflicts = None
+            self.watch_map_file(filepath)
+            self.refresh_disk_digests(grids)
+            self.canvas.update()
+            self.statusBar().showMessage(u"地图已保存: {}".format(self.current_map_name))
+            self.run_validation()
+            return True
         except Exception as e:
             QMessageBox.critical(self, u"错误", u"保存地图失败: {}".format(e))
             return False
@@ -430,14 +937,364 @@ R：重置视图
             map_name = os.path.splitext(os.path.basename(filename))[0]
             self.load_map(map_name)
     
+    def diff_map_dialog(self):
+        """选择另一版本的地图，与当前编辑内容对比并叠加显示差异"""
+        if self.map_data is None:
+            QMessageBox.warning(self, u"警告", u"没有打开任何地图")
+            return
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            u"选择对比的地图文件",
+            self.basepath,
+            u"JSON 文件 (*.json)"
+        )
+        if filename:
+            self.diff_against(filename)
+    
+    def diff_against(self, filepath):
+        """以 filepath 为旧版本、当前地图为新版本计算差异"""
+        try:
+            old_data, old_codes, old_grids, _ = read_map_file(filepath, self.cache_dir)
+            old_layers, _ = build_layers(old_data, dict(old_grids, **{TERRAIN: old_codes}))
+        except Exception as e:
+            QMessageBox.critical(self, u"错误", u"加载对比地图失败: {}".format(e))
+            return False
+        codes = self.codes
+        # 补丁按保存时的内容对比：只含需要写出的图层，layers / palettes 元数据在副本上生成
+        new_data = dict(self.map_data)
+        if 'palettes' in new_data:
+            new_data['palettes'] = dict(new_data['palettes'])
+        new_grids = prepare_for_write(new_data, self.layers)
+        self.diff_patch = diff_maps(old_data, old_codes, new_data, codes, old_layers=old_grids, new_layers=new_grids)
+        # 高亮按各图层的实际内容（含由 terrain 推导的碰撞层），未写在文件中的图层不会整片标为变化
+        mask = changed_mask(old_codes, codes)
+        for name, layer in self.layers.items():
+            if name != TERRAIN and name in old_layers:
+                mask |= changed_mask(old_layers[name].codes, layer.codes)
+        self.diff_mask = mask
+        self.diff_check.setChecked(True)
+        self.canvas.update()
+        summary = format_patch(self.diff_patch)
+        headline = u"；".join(line for line in summary.splitlines() if not line.startswith(u"  "))
+        self.statusBar().showMessage(u"与 {} 对比: {}".format(os.path.basename(filepath), headline))
+        return True
+    
+    def clear_diff(self):
+        """清除差异叠加"""
+        self.diff_patch = None
+        self.diff_mask = None
+        self.canvas.update()
+    
+    def run_console_script(self):
+        """运行控制台中的脚本"""
+        self.run_script_source(self.script_edit.toPlainText(), "<console>")
+    
+    def run_script_dialog(self):
+        """选择脚本文件并运行"""
+        filename, _ = QFileDialog.getOpenFileName(self, u"运行脚本", self.basepath, u"Python 脚本 (*.py)")
+        if not filename:
+            return
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                source = f.read()
+        except Exception as e:
+            QMessageBox.critical(self, u"错误", u"读取脚本失败: {}".format(e))
+            return
+        self.run_script_source(source, filename)
+    
+    def run_script_source(self, source, filename):
+        """对当前地图执行脚本：整体作为一条撤销记录，结束后统一重绘一次"""
+        if self.map_data is None:
+            QMessageBox.warning(self, u"警告", u"没有打开任何地图")
+            return False
+        started = time.perf_counter()
+        ok, output, records = run_script(MapScript(self.map_data, self.layers), source, filename)
+        elapsed = time.perf_counter() - started
+        self.script_output.appendPlainText(u">>> {}".format(filename))
+        if output:
+            self.script_output.appendPlainText(output.rstrip("\n"))
+        if not ok:
+            self.statusBar().showMessage(u"脚本出错，修改已回滚")
+            return False
+        
+        if records:
+            self.dirty = True
+            self.undo_stack.append(records)
+            del self.undo_stack[:-UNDO_LIMIT]
+            for record in records:
+                self.canvas.invalidate_layer(record['layer'], record['rect'])
+                self.live_tiles(record['layer'], record['rect'])
+                if record['layer'] == TERRAIN:
+                    self.terrain_changed(record['rect'])
+            self.live_objects()
+            self.selected_entity = None
+            self.selected_enemy = None
+            self.canvas.update()
+            self.run_validation()
+        self.statusBar().showMessage(u"脚本完成（{:.0f} ms），修改了 {} 个图层{}".format(
+            elapsed * 1000, sum(1 for r in records if r['codes'].size), u"" if records else u"，地图未变化"))
+        return True
+    
+    def watch_map_file(self, filepath):
+        """监视当前地图文件（配置 watch.enabled 为假时不监视）"""
+        files = self.watcher.files()
+        if files:
+            self.watcher.removePaths(files)
+        if self.config.get('watch', {}).get('enabled', True):
+            self.watcher.addPath(filepath)
+    
+    def refresh_disk_digests(self, grids):
+        """记下与文件同步时的内容摘要：grids 为文件中的网格，复制后在后台构造图层并分块求摘要"""
+        self.digest_serial += 1
+        serial = self.digest_serial
+        self.disk_digests = None
+        fields = field_digests(self.map_data)
+        meta = copy.deepcopy({k: self.map_data[k] for k in ('tile_info', 'layers') if k in self.map_data})
+        grids = {name: codes.copy() for name, codes in grids.items()}
+        
+        def worker():
+            layers, _ = build_layers(meta, grids)
+            digests = grid_digests({name: layer.codes for name, layer in layers.items()})
+            digests['fields'] = fields
+            self.digests_ready.emit(serial, digests)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def on_digests_ready(self, serial, digests):
+        if serial == self.digest_serial:
+            self.disk_digests = digests
+    
+    def on_file_changed(self, path):
+        """地图文件被改写：等写入完成后在后台重新读取"""
+        delay = self.config.get('watch', {}).get('debounce_ms', WATCH_DEBOUNCE_MS)
+        self.reload_timer.start(int(delay))
+    
+    def start_reload(self):
+        """后台读取改写后的地图文件并求摘要，结果通过 reload_ready 回到界面线程"""
+        if self.map_data is None:
+            return
+        filepath = os.path.join(self.basepath, u"{}.json".format(self.current_map_name))
+        if not os.path.exists(filepath):
+            return
+        # 原子替换（写临时文件再改名）后原来的监视失效
+        if filepath not in self.watcher.files():
+            self.watcher.addPath(filepath)
+        if self.disk_digests is None:
+            self.reload_timer.start(WATCH_DEBOUNCE_MS)
+            return
+        self.reload_serial += 1
+        serial = self.reload_serial
+        digest_serial = self.digest_serial
+        cache_dir = self.cache_dir
+        
+        def worker():
+            try:
+                map_data, grids, _ = read_map(filepath, cache_dir)
+                layers, _ = build_layers(map_data, grids)
+                digests = map_digests(map_data, {name: layer.codes for name, layer in layers.items()})
+                result = (digest_serial, map_data, layers, digests)
+            except Exception:
+                # 文件可能还没写完，等下一次变化通知
+                result = None
+            self.reload_ready.emit(serial, result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def on_reload_ready(self, serial, result):
+        """三方比较后只应用磁盘上变化、本地未改的块与字段；冲突保留本地内容并提示"""
+        if serial != self.reload_serial or result is None:
+            return
+        digest_serial, map_data, layers, digests = result
+        if digest_serial != self.digest_serial or self.disk_digests is None:
+            # 读取期间保存或重新打开了地图，按新的摘要重新比较
+            self.reload_timer.start(0)
+            return
+        plan = plan_reload(self.disk_digests, digests, self.map_data, self.layers)
+        if not self.layers[COLLISION].persist and not layers[COLLISION].persist:
+            # 两边的碰撞层都由 terrain 推导：不单独比较，随 terrain 的变化重新推导
+            plan.chunks.pop(COLLISION, None)
+            plan.conflicts.pop(COLLISION, None)
+        if not plan:
+            self.disk_digests = digests
+            return
+        if plan.shape_changed:
+            if self.dirty and QMessageBox.question(
+                    self, u"地图已被修改",
+                    u"地图文件已被其他程序修改，且尺寸发生了变化。\n重新加载会丢弃未保存的修改，是否重新加载？"
+            ) != QMessageBox.StandardButton.Yes:
+                self.disk_digests = digests
+                self.statusBar().showMessage(u"地图文件尺寸已变化，保留了当前内容；保存将覆盖磁盘上的版本")
+                return
+            self.load_map(self.current_map_name)
+            return
+        
+        self.apply_reload(plan.chunks, plan.fields, map_data, layers)
+        self.disk_digests = digests
+        message = u"已载入外部修改：{} 个区块{}".format(
+            plan.chunk_count(), u"，字段 " + u"/".join(plan.fields) if plan.fields else u"")
+        if plan.conflict_count():
+            self.reload_conflicts = plan
+            self.canvas.update()
+            fields = u"，字段 " + u"/".join(plan.field_conflicts) if plan.field_conflicts else u""
+            answer = QMessageBox.question(
+                self, u"外部修改冲突",
+                u"地图文件已被其他程序修改，其中 {} 个格子{}在本地也有不同的未保存修改。\n"
+                u"是否采用磁盘上的版本？选择\"否\"保留本地内容（冲突格子以红色标出）。".format(
+                    plan.conflict_cells(), fields),
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No)
+            if answer == QMessageBox.StandardButton.Yes:
+                self.apply_reload(plan.conflicts, plan.field_conflicts, map_data, layers)
+                self.reload_conflicts = None
+                self.canvas.update()
+            else:
+                message += u"；{} 处冲突保留了本地内容".format(plan.conflict_count())
+        self.statusBar().showMessage(message)
+        self.run_validation()
+    
+    def apply_reload(self, chunks, fields, map_data, layers):
+        """把磁盘上的块（或块内 mask 标出的格子）与字段写入当前地图，只重绘变化的部分"""
+        for name, items in chunks.items():
+            codes = self.layers[name].codes
+            for (r0, c0, r1, c1), mask in items:
+                block = codes[r0:r1, c0:c1]
+                disk = layers[name].codes[r0:r1, c0:c1]
+                if mask is None:
+                    block[...] = disk
+                else:
+                    block[mask] = disk[mask]
+                self.canvas.invalidate_layer(name, (r0, c0, r1, c1))
+                self.live_tiles(name, (r0, c0, r1, c1))
+                if name == TERRAIN:
+                    self.terrain_changed((r0, c0, r1, c1))
+            self.layers[name].persist = self.layers[name].persist or layers[name].persist
+        
+        refresh = False
+        for key in fields:
+            old = self.map_data.get(key)
+            if key in map_data:
+                self.map_data[key] = map_data[key]
+            else:
+                self.map_data.pop(key, None)
+            if key in OBJECT_POS_KEYS:
+                self.repaint_objects(old, map_data.get(key), OBJECT_POS_KEYS[key])
+            elif key == 'playerSpawn':
+                for spawn in (old, map_data.get(key)):
+                    if spawn:
+                        self.repaint_point(spawn.get('x', 0), spawn.get('y', 0))
+            else:
+                refresh = True
+            if key in OBJECT_KINDS:
+                self.live_objects(key)
+        if 'entity' in fields:
+            self.selected_entity = None
+        if 'enemy' in fields:
+            self.selected_enemy = None
+        if 'layers' in fields:
+            for name, layer in layers.items():
+                self.layers[name].palette = layer.palette
+                self.layers[name].visible = layer.visible
+                self.layers[name].opacity = layer.opacity
+        if 'tile_info' in fields and refresh_collision(self.map_data, self.layers):
+            self.live_tiles(COLLISION, (0, 0) + self.codes.shape)
+        if refresh:
+            self.canvas.invalidate_layer()
+            self.update_ui()
+    
+    def object_scale(self):
+        """对象坐标（每格 map_info.tilesize）换算到屏幕的比例：每个单位对应的像素数（含缩放）"""
+        return self.zoom * TILE_PX / map_tilesize(self.map_data)
+    
+    def repaint_objects(self, old, new, pos_key):
+        """只重绘增加、删除或改动过的对象标记"""
+        before = {json.dumps(obj, sort_keys=True): obj for obj in old or []}
+        after = {json.dumps(obj, sort_keys=True): obj for obj in new or []}
+        for key in before.keys() ^ after.keys():
+            x, y = (before.get(key) or after[key])[pos_key]
+            self.repaint_point(x, y)
+    
+    def repaint_point(self, x, y):
+        tilesize = map_tilesize(self.map_data)
+        row, col = int(y // tilesize), int(x // tilesize)
+        self.canvas.update(self.canvas.cells_rect(row, col, row + 1, col + 1))
+    
+    def run_validation(self):
+        """在后台线程检查当前地图，结果通过 validation_finished 回到界面线程"""
+        if self.map_data is None:
+            return
+        self.validation_serial += 1
+        serial = self.validation_serial
+        map_data = copy.deepcopy(self.map_data)
+        codes = self.codes.copy()
+        ragged = list(self.load_info.get('ragged', []))
+        layers = {name: (layer.palette, layer.codes.copy()) for name, layer in self.layers.items()
+                  if name != TERRAIN and layer.persist}
+        mismatch = list(self.load_info.get('layer_mismatch', []))
+        
+        def worker():
+            try:
+                issues = validate_map(map_data, codes, ragged, layers, mismatch)
+            except Exception as e:
+                issues = [{"severity": ERROR, "check": "internal", "message": u"检查失败: {}".format(e),
+                           "rect": None, "pos": None, "count": 0}]
+            self.validation_finished.emit(serial, issues)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def on_validation_finished(self, serial, issues):
+        """显示检查结果（忽略已过期的检查）"""
+        if serial != self.validation_serial:
+            return
+        self.validation_issues = issues
+        self.issue_list.clear()
+        for issue in issues:
+            item = QListWidgetItem(format_issue(issue))
+            item.setData(Qt.ItemDataRole.UserRole, issue)
+            if issue['severity'] == ERROR:
+                item.setForeground(QColor(220, 60, 60))
+            self.issue_list.addItem(item)
+        errors = sum(1 for i in issues if i['severity'] == ERROR)
+        if issues:
+            self.statusBar().showMessage(u"地图检查: {} 个错误，{} 个警告".format(errors, len(issues) - errors))
+    
+    def on_issue_clicked(self, item):
+        """点击检查结果，跳转到问题位置"""
+        self.jump_to_issue(item.data(Qt.ItemDataRole.UserRole))
+    
+    def jump_to_issue(self, issue):
+        """把视图移到问题所在位置；格子类问题同时设为选区以便高亮"""
+        if self.map_data is None:
+            return
+        tile_size = int(40 * self.zoom)
+        cx = self.canvas.width() / 2.0
+        cy = self.canvas.height() / 2.0
+        if issue.get('rect'):
+            x, y, w, h = issue['rect']
+            self.offset_x = int(cx - (x + w / 2.0) * tile_size)
+            self.offset_y = int(cy - (y + h / 2.0) * tile_size)
+            self.selection = (y, x, y + h, x + w)
+        elif issue.get('pos'):
+            x, y = issue['pos']
+            self.offset_x = int(cx - x * self.object_scale())
+            self.offset_y = int(cy - y * self.object_scale())
+        else:
+            return
+        self.canvas.update()
+        self.save_last_state()
+    
     def update_ui(self):
         """更新 UI 元素"""
         if self.map_data is None:
             return
         
-        # 更新地砖选择下拉列表
+        # 图层显示状态
+        for name, layer in self.layers.items():
+            self.layer_checks[name].setChecked(layer.visible)
+            self.layer_opacity_spins[name].setValue(int(round(layer.opacity * 100)))
+        
+        # 更新地砖选择下拉列表（当前编辑图层的调色板）
         self.tile_combo.clear()
-        tile_info = self.map_data.get('tile_info', {})
+        tile_info = palette_for(self.map_data, self.layers[self.active_layer])
         tile_ids = sorted([int(k) for k in tile_info.keys()])
         
         for tile_id in tile_ids:
@@ -455,11 +1312,13 @@ R：重置视图
             EditMode.TILE: u"地砖编辑",
             EditMode.ENTITY: u"实体编辑",
             EditMode.SPAWN: u"生成点编辑",
-            EditMode.ENEMY: u"敌人编辑"
+            EditMode.ENEMY: u"敌人编辑",
+            EditMode.SELECT: u"选区编辑"
         }
         
         status_text = u"""地图: {}
 模式: {}
+图层: {}
 选中地砖: {}
 缩放: {:.1f}x
 网格: {}
@@ -468,6 +1327,7 @@ R：重置视图
 生成点: {}""".format(
             self.current_map_name,
             mode_names.get(self.edit_mode, u"未知"),
+            LAYER_TITLES[self.active_layer],
             self.selected_tile_id,
             self.zoom,
             u"✓" if self.show_grid else u"✗",
@@ -480,10 +1340,103 @@ R：重置视图
     
     def on_mode_changed(self, index):
         """编辑模式变更"""
-        modes = [EditMode.TILE, EditMode.ENTITY, EditMode.SPAWN, EditMode.ENEMY]
+        modes = [EditMode.TILE, EditMode.ENTITY, EditMode.SPAWN, EditMode.ENEMY, EditMode.SELECT]
         self.edit_mode = modes[index]
         self.update_status()
     
+    def on_layer_changed(self, index):
+        """编辑图层变更：地砖列表改为该图层的调色板"""
+        self.active_layer = self.layer_combo.itemData(index)
+        self.update_ui()
+    
+    def on_layer_visibility_changed(self, name):
+        """图层显示开关（只重新合成，不重新栅格化）"""
+        if name in self.layers:
+            self.layers[name].visible = self.layer_checks[name].isChecked()
+            self.canvas.update()
+    
+    def on_layer_opacity_changed(self, name):
+        """图层不透明度变更"""
+        if name in self.layers:
+            self.layers[name].opacity = self.layer_opacity_spins[name].value() / 100.0
+            self.canvas.update()
+    
+    def active_codes(self):
+        """当前编辑图层的编码网格"""
+        return self.layers[self.active_layer].codes
+    
+    def blank_code(self):
+        """当前编辑图层中表示清空的 code：terrain 为默认地砖，其余图层为空"""
+        return 1 if self.active_layer == TERRAIN else EMPTY_CODE
+    
+    def layer_edited(self, r0, c0, r1, c1):
+        """当前图层被修改：标记需要保存，并只更新该图层受影响部分的栅格"""
+        layer = self.layers[self.active_layer]
+        if self.active_layer == COLLISION and not layer.persist:
+            # 第一次编辑推导出的碰撞层：其余部分以当前 terrain 重新推导后再固定下来
+            edited = layer.codes[r0:r1, c0:c1].copy()
+            refresh_collision(self.map_data, self.layers)
+            layer.codes[r0:r1, c0:c1] = edited
+            self.canvas.invalidate_layer(COLLISION)
+            self.live_tiles(COLLISION, (0, 0) + layer.codes.shape)
+        layer.persist = True
+        self.dirty = True
+        self.canvas.invalidate_layer(self.active_layer, (r0, c0, r1, c1))
+        self.live_tiles(self.active_layer, (r0, c0, r1, c1))
+        if self.active_layer == TERRAIN:
+            self.terrain_changed((r0, c0, r1, c1))
+    
+    def terrain_changed(self, rect):
+        """terrain 变化后，未编辑过的碰撞层随之重新推导"""
+        if refresh_collision(self.map_data, self.layers, rect):
+            self.canvas.invalidate_layer(COLLISION, rect)
+            self.live_tiles(COLLISION, rect)
+    
+    def toggle_live(self, enabled):
+        """开启/关闭实时推送：在本机端口等待游戏连接"""
+        if not enabled:
+            if self.live_server is not None:
+                self.live_timer.stop()
+                self.live_server.stop()
+                self.live_server = None
+                self.statusBar().showMessage(u"实时推送已关闭")
+            return
+        if self.config is None:
+            self.load_config()
+        live = self.config.get('live', {})
+        server = LiveServer(live.get('host', LIVE_HOST), int(live.get('port', LIVE_PORT)))
+        try:
+            server.start()
+        except OSError as e:
+            QMessageBox.warning(self, u"错误", u"无法开启实时推送: {}".format(e))
+            self.live_check.setChecked(False)
+            return
+        self.live_server = server
+        self.live_delta.clear()
+        self.live_timer.start()
+        self.statusBar().showMessage(u"实时推送已开启: {}:{}".format(server.host, server.port))
+    
+    def live_tiles(self, name, rect):
+        """记录推送用的地砖修改（下一帧统一发送）"""
+        if self.live_server is not None:
+            self.live_delta.mark_tiles(name, rect)
+    
+    def live_objects(self, *kinds):
+        """记录推送用的对象修改；不指定种类时推送全部对象列表"""
+        if self.live_server is not None:
+            self.live_delta.mark_objects(*kinds)
+    
+    def flush_live(self):
+        """每帧一次：给新连接发送快照，再把本帧合并后的修改广播出去"""
+        if self.live_server is None or self.map_data is None:
+            return
+        waiting = self.live_server.take_waiting()
+        if waiting:
+            self.live_server.send_snapshot(waiting, self.map_data, self.layers)
+        message = self.live_delta.take(self.map_data, self.layers)
+        if message is not None:
+            self.live_server.broadcast(message)
+    
     def on_tile_changed(self, index):
         """地砖选择变更"""
         if self.map_data and index >= 0:
@@ -506,25 +1459,180 @@ R：重置视图
         self.save_last_state()
     
     def set_tile_at(self, row, col, tile_id):
-        """设置指定位置的地砖"""
+        """在当前编辑图层上设置指定位置的地砖"""
         if self.map_data is None:
             return False
         
-        map_grid = self.map_data.get('map', [])
-        if 0 <= row < len(map_grid) and 0 <= col < len(map_grid[0]):
-            tile_info = self.map_data['tile_info'].get(str(tile_id))
+        codes = self.active_codes()
+        rows, cols = codes.shape
+        if 0 <= row < rows and 0 <= col < cols:
+            tile_info = palette_for(self.map_data, self.layers[self.active_layer]).get(str(tile_id))
             if tile_info:
-                map_grid[row][col] = tile_info
+                codes[row, col] = tile_id
+                self.layer_edited(row, col, row + 1, col + 1)
                 return True
         return False
     
+    def erase_tile_at(self, row, col):
+        """清除当前编辑图层上指定位置的地砖"""
+        if self.map_data is None:
+            return False
+        codes = self.active_codes()
+        rows, cols = codes.shape
+        if 0 <= row < rows and 0 <= col < cols:
+            codes[row, col] = self.blank_code()
+            self.layer_edited(row, col, row + 1, col + 1)
+            return True
+        return False
+    
+    def set_selection(self, start, end):
+        """以两个格子为对角设置选区（裁剪到地图范围内）"""
+        if self.codes is None:
+            return
+        rows, cols = self.codes.shape
+        r0, r1 = sorted((start[0], end[0]))
+        c0, c1 = sorted((start[1], end[1]))
+        r0, c0 = max(r0, 0), max(c0, 0)
+        r1, c1 = min(r1 + 1, rows), min(c1 + 1, cols)
+        self.selection = (r0, c0, r1, c1) if r0 < r1 and c0 < c1 else None
+    
+    def push_undo(self, r0, c0, r1, c1):
+        """在修改区域前记录撤销信息（记录所在图层），返回该记录"""
+        record = snapshot(self.map_data, self.active_codes(), r0, c0, r1, c1)
+        record['layer'] = self.active_layer
+        self.undo_stack.append(record)
+        del self.undo_stack[:-UNDO_LIMIT]
+        return record
+    
+    def undo(self):
+        """撤销最近一次区域修改"""
+        if not self.undo_stack:
+            self.statusBar().showMessage(u"没有可撤销的操作")
+            return
+        record = self.undo_stack.pop()
+        self.dirty = True
+        self.selected_entity = None
+        self.selected_enemy = None
+        if isinstance(record, list):
+            # 脚本运行：一组跨图层的记录，对象可能在地图任意位置
+            for item in reversed(record):
+                rect = restore(self.map_data, self.layers[item['layer']].codes, item)
+                self.canvas.invalidate_layer(item['layer'], rect)
+                self.live_tiles(item['layer'], rect)
+                if item['layer'] == TERRAIN:
+                    self.terrain_changed(rect)
+            self.live_objects()
+            self.canvas.update()
+            return
+        name = record.get('layer', TERRAIN)
+        rect = restore(self.map_data, self.layers[name].codes, record)
+        self.canvas.invalidate_layer(name, rect)
+        self.live_tiles(name, rect)
+        if name == TERRAIN:
+            self.terrain_changed(rect)
+        self.live_objects()
+        self.canvas.update(self.canvas.cells_rect(*rect))
+    
+    def copy_selection(self):
+        """复制选区到剪贴板"""
+        if self.selection is None:
+            self.statusBar().showMessage(u"请先在选区编辑模式下框选区域")
+            return False
+        self.clipboard = copy_region(self.map_data, self.active_codes(), *self.selection, map_tilesize(self.map_data))
+        self.statusBar().showMessage(u"已复制 {}x{} 区域".format(self.clipboard.width, self.clipboard.height))
+        return True
+    
+    def cut_selection(self):
+        """剪切选区：复制后清空为默认地砖"""
+        if not self.copy_selection():
+            return
+        record = self.push_undo(*self.selection)
+        clear_region(self.map_data, self.active_codes(), *self.selection, map_tilesize(self.map_data), self.blank_code(), record)
+        self.selected_entity = None
+        self.selected_enemy = None
+        self.layer_edited(*self.selection)
+        self.live_objects()
+        self.canvas.update(self.canvas.cells_rect(*self.selection))
+    
+    def paste_clipboard(self, row=None, col=None):
+        """把剪贴板内容贴到 (row, col)，缺省为光标所在格子；一次写入、一条撤销记录"""
+        if self.clipboard is None or self.codes is None:
+            self.statusBar().showMessage(u"剪贴板为空")
+            return False
+        if row is None or col is None:
+            row, col = getattr(self.canvas, 'hover_cell', None) or (self.selection or (0, 0))[:2]
+        region = self.clipboard
+        rows, cols = self.codes.shape
+        r0, c0 = max(row, 0), max(col, 0)
+        r1, c1 = min(row + region.height, rows), min(col + region.width, cols)
+        if r0 >= r1 or c0 >= c1:
+            return False
+        record = self.push_undo(r0, c0, r1, c1)
+        rect = paste_region(self.map_data, self.active_codes(), region, row, col, map_tilesize(self.map_data), record)
+        self.selection = rect
+        self.layer_edited(*rect)
+        self.live_objects()
+        self.canvas.update(self.canvas.cells_rect(*rect))
+        self.statusBar().showMessage(u"已粘贴 {}x{} 区域".format(c1 - c0, r1 - r0))
+        return True
+    
+    def load_stamp_library(self):
+        """读取图章库，读取失败时返回空库"""
+        try:
+            return load_stamps(self.stamps_path)
+        except Exception:
+            return {}
+    
+    def refresh_stamp_combo(self):
+        """刷新图章下拉列表"""
+        self.stamp_combo.clear()
+        self.stamp_combo.addItem(u"（选择图章）", None)
+        for name, region in sorted(self.stamps.items()):
+            self.stamp_combo.addItem(u"{} ({}x{})".format(name, region.width, region.height), name)
+    
+    def on_stamp_chosen(self, index):
+        """选择图章后放入剪贴板，Ctrl+V 粘贴"""
+        name = self.stamp_combo.itemData(index)
+        if name in self.stamps:
+            self.clipboard = self.stamps[name]
+            self.statusBar().showMessage(u"图章 {} 已放入剪贴板".format(name))
+    
+    def save_stamp(self):
+        """把选区保存为图章"""
+        if self.selection is None:
+            self.statusBar().showMessage(u"请先在选区编辑模式下框选区域")
+            return
+        name, ok = QInputDialog.getText(self, u"保存图章", u"图章名称:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        self.stamps[name] = copy_region(self.map_data, self.active_codes(), *self.selection, map_tilesize(self.map_data))
+        try:
+            save_stamps(self.stamps_path, self.stamps)
+        except Exception as e:
+            QMessageBox.critical(self, u"错误", u"保存图章失败: {}".format(e))
+        self.refresh_stamp_combo()
+    
+    def delete_stamp(self):
+        """删除当前选择的图章"""
+        name = self.stamp_combo.currentData()
+        if name not in self.stamps:
+            return
+        del self.stamps[name]
+        try:
+            save_stamps(self.stamps_path, self.stamps)
+        except Exception as e:
+            QMessageBox.critical(self, u"错误", u"保存图章失败: {}".format(e))
+        self.refresh_stamp_combo()
+    
     def add_or_select_entity(self, world_x, world_y):
         """添加或选择实体"""
         entities = self.map_data.get('entity', [])
         
+        radius = 30 * map_tilesize(self.map_data) / TILE_PX
         for entity in entities:
             ex, ey = entity['position']
-            if abs(ex - world_x) < 30 and abs(ey - world_y) < 30:
+            if abs(ex - world_x) < radius and abs(ey - world_y) < radius:
                 self.selected_entity = entity
                 return
         
@@ -534,14 +1642,17 @@ R：重置视图
         }
         entities.append(new_entity)
         self.selected_entity = new_entity
+        self.dirty = True
+        self.live_objects('entity')
     
     def add_or_select_enemy(self, world_x, world_y):
         """添加或选择敌人"""
         enemies = self.map_data.get('enemy', [])
         
+        radius = 30 * map_tilesize(self.map_data) / TILE_PX
         for enemy in enemies:
             ex, ey = enemy['spawn']
-            if abs(ex - world_x) < 30 and abs(ey - world_y) < 30:
+            if abs(ex - world_x) < radius and abs(ey - world_y) < radius:
                 self.selected_enemy = enemy
                 return
         
@@ -552,12 +1663,16 @@ R：重置视图
         }
         enemies.append(new_enemy)
         self.selected_enemy = new_enemy
+        self.dirty = True
+        self.live_objects('enemy')
     
     def set_player_spawn(self, world_x, world_y):
         """设置玩家生成点"""
         spawn = self.map_data.get('playerSpawn', {})
         spawn['x'] = world_x
         spawn['y'] = world_y
+        self.dirty = True
+        self.live_objects('playerSpawn')
     
     def keyPressEvent(self, event):
         """键盘事件"""
@@ -567,11 +1682,15 @@ R：重置视图
                 if self.selected_entity in entities:
                     entities.remove(self.selected_entity)
                     self.selected_entity = None
+                    self.dirty = True
+                    self.live_objects('entity')
             if self.selected_enemy:
                 enemies = self.map_data.get('enemy', [])
                 if self.selected_enemy in enemies:
                     enemies.remove(self.selected_enemy)
                     self.selected_enemy = None
+                    self.dirty = True
+                    self.live_objects('enemy')
             self.canvas.update()
         
         elif event.key() == Qt.Key.Key_R:
@@ -585,22 +1704,31 @@ R：重置视图
             self.mode_combo.setCurrentIndex(2)
         elif event.key() == Qt.Key.Key_4:
             self.mode_combo.setCurrentIndex(3)
+        elif event.key() == Qt.Key.Key_5:
+            self.mode_combo.setCurrentIndex(4)
         
         elif event.key() == Qt.Key.Key_S and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
             self.save_map()
+        elif event.key() == Qt.Key.Key_C and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
+            self.copy_selection()
+        elif event.key() == Qt.Key.Key_X and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
+            self.cut_selection()
+        elif event.key() == Qt.Key.Key_V and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
+            self.paste_clipboard()
+        elif event.key() == Qt.Key.Key_Z and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
+            self.undo()
+        elif event.key() == Qt.Key.Key_Escape:
+            self.selection = None
+            self.canvas.update()
         
         else:
             super().keyPressEvent(event)
 
     def center_view(self):
         """将地图居中到画布"""
-        if not self.map_data:
+        if not self.map_data or self.codes is None or not self.codes.size:
             return
-        map_grid = self.map_data.get('map', [])
-        if not map_grid or not map_grid[0]:
-            return
-        rows = len(map_grid)
-        cols = len(map_grid[0])
+        rows, cols = self.codes.shape
         tile_size = int(40 * self.zoom)
         map_w = cols * tile_size
         map_h = rows * tile_size
@@ -616,12 +1744,33 @@ R：重置视图
         self.canvas.update()
         self.save_last_state()
 
+    def finish_startup(self):
+        """首次绘制之后：读取配置、加载上次的地图，并记录启动耗时"""
+        self.load_config()
+        self.last_load_cached = None
+        loaded = self.load_map()
+        self.startup_times['map_ready'] = time.perf_counter() - STARTED_AT
+        
+        if loaded:
+            kind = u"缓存命中" if self.last_load_cached else u"解析 JSON"
+        else:
+            kind = u"未加载地图"
+        report = u"启动耗时: 首帧 {:.0f} ms，地图就绪 {:.0f} ms（{}）".format(
+            self.startup_times['first_paint'] * 1000, self.startup_times['map_ready'] * 1000, kind)
+        self.statusBar().showMessage(report)
+        if self.exit_after_startup:
+            # --startup-bench：输出到终端供脚本采集后退出
+            print(report)
+            QTimer.singleShot(0, QApplication.instance().quit)
+    
     def load_config(self):
         """读取配置文件，若不存在则使用默认配置"""
         defaults = {
             "zoom": {"min": 0.5, "max": 3.0, "wheel_factor": 1.05},
-            "view": {"center_on_load": True},
+            "view": {"center_on_load": True, "settle_delay_ms": SETTLE_DELAY_MS},
             "persist": {"remember_last_view": True},
+            "live": {"host": LIVE_HOST, "port": LIVE_PORT},
+            "watch": {"enabled": True, "debounce_ms": WATCH_DEBOUNCE_MS},
             "last_state": None
         }
         try:
@@ -664,7 +1813,7 @@ R：重置视图
 
     def save_last_state(self):
         """保存当前视图位置与缩放"""
-        if not self.config.get('persist', {}).get('remember_last_view'):
+        if self.config is None or not self.config.get('persist', {}).get('remember_last_view'):
             return
         self.config['last_state'] = {
             'zoom': self.zoom,
@@ -680,17 +1829,19 @@ R：重置视图
     def closeEvent(self, event):
         """窗口关闭时保存状态"""
         self.save_last_state()
+        if self.live_server is not None:
+            self.live_server.stop()
         super().closeEvent(event)
 
 
 def main():
     app = QApplication(sys.argv)
     editor = MapEditorQt()
+    # --startup-bench：加载完默认地图后立即退出，用于统计冷/热启动耗时
+    editor.exit_after_startup = "--startup-bench" in sys.argv
     editor.show()
     
-    # 尝试加载默认地图
-    editor.load_map()
-    
+    # 默认地图在首次绘制后加载（见 MapCanvas.draw_placeholder）
     sys.exit(app.exec())
 
 
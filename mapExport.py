@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+地图预览图导出：瓦片金字塔（z/x/y.png）+ 一张总览图
+
+    python3 mapExport.py start_cave.json -o export/start_cave [--tile-px 8] [--jobs 4]
+
+第 zmax 层每格 tile_px 像素，往上每层缩小一半，第 0 层整张地图放进一块瓦片。
+不依赖 Qt 与显示器：各图层先按格子合成为 RGBA 数组并逐级 2x2 平均，
+瓦片由进程池并行切片、绘制对象标记并编码为 PNG。
+
+输出目录中的 manifest.json 记录每块瓦片的内容摘要（底层瓦片为所覆盖的格子与对象，
+上层瓦片由下层摘要合成）；再次导出时只重新渲染摘要变化的瓦片。
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from mapCache import CACHE_DIRNAME, read_map
+from mapGrid import OBJECT_POS_KEYS, TILE_PX, map_tilesize
+from mapLayers import LAYER_NAMES, TERRAIN, build_layers, layer_rgba
+
+
+EXPORT_FORMAT = "ionic-map-tiles"
+EXPORT_VERSION = 1
+
+# 瓦片边长（像素）与底层每格像素数，均须为 2 的幂
+TILE_SIZE = 256
+TILE_PX_DEFAULT = 8
+
+# 总览图长边的上限（像素）
+OVERVIEW_SIZE = 2048
+
+# 地图以外的底色（与 MapCanvas 背景一致）与合成时每批处理的行数
+BACKGROUND_COLOR = (30, 30, 30)
+COMPOSITE_ROWS = 256
+
+# 各层 code 组合数超过此值时改为逐格混合
+COMBO_LIMIT = 1 << 20
+
+# 对象标记：与 MapCanvas 相同的颜色和大小（半边长 15 像素，白色描边 2 像素）
+MARKER_HALF = 15
+MARKER_COLORS = {"entity": (0, 200, 0), "enemy": (200, 0, 0), "spawn": (0, 0, 255)}
+OUTLINE_COLOR = (255, 255, 255)
+
+
+def write_png(filepath, rgba):
+    """把 (h, w, 4) 的 uint8 数组写为 PNG"""
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(tag, payload):
+        return (struct.pack(">I", len(payload)) + tag + payload
+                + struct.pack(">I", zlib.crc32(tag + payload) & 0xffffffff))
+
+    data = (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+
+
+def composite_cells(layers, names):
+    """按格子合成可见图层，返回 (rows, cols, 4) 的 uint8 数组（每格一个像素）
+
+    每层只出现少数几种 code，先对各层 code 的所有组合算好颜色，
+    再把每格的组合编号查表，避免逐格做浮点混合。
+    """
+    terrain = layers[TERRAIN].codes
+    index_luts = []
+    palettes = []
+    for name in names:
+        codes = layers[name].codes
+        present = np.flatnonzero(np.bincount(codes.ravel(), minlength=1))
+        index = np.zeros(int(present[-1]) + 1, dtype=np.int32)
+        index[present] = np.arange(present.size)
+        rgba = np.array([layer_rgba(name, code) for code in present.tolist()], dtype=np.float32)
+        rgba[:, 3] *= layers[name].opacity / 255.0
+        index_luts.append(index)
+        palettes.append(rgba)
+
+    sizes = [len(p) for p in palettes]
+    if np.prod(sizes, dtype=np.float64) > COMBO_LIMIT:
+        return _blend_cells(terrain.shape, layers, names, index_luts, palettes)
+
+    # 所有组合的颜色：组合编号 = sum(各层下标 * 后续各层种类数之积)
+    combos = np.indices(sizes).reshape(len(sizes), -1) if sizes else np.zeros((0, 1), dtype=np.int64)
+    rgb = np.empty((combos.shape[1], 3), dtype=np.float32)
+    rgb[:] = BACKGROUND_COLOR
+    for palette, idx in zip(palettes, combos):
+        color = palette[idx]
+        rgb += (color[:, :3] - rgb) * color[:, 3:]
+    table = np.empty((combos.shape[1], 4), dtype=np.uint8)
+    table[:, :3] = np.clip(rgb + 0.5, 0, 255)
+    table[:, 3] = 255
+
+    # 只有一种 code 的图层（如空的装饰层）不影响组合编号
+    varying = [(name, index, size) for name, index, size in zip(names, index_luts, sizes) if size > 1]
+    key_dtype = np.int32 if combos.shape[1] < 2 ** 31 else np.int64
+    out = np.empty(terrain.shape + (4,), dtype=np.uint8)
+    for r0 in range(0, terrain.shape[0], COMPOSITE_ROWS):
+        r1 = min(r0 + COMPOSITE_ROWS, terrain.shape[0])
+        key = np.zeros((r1 - r0, terrain.shape[1]), dtype=key_dtype)
+        for name, index, size in varying:
+            key *= size
+            key += index[layers[name].codes[r0:r1]]
+        out[r0:r1] = table[key]
+    return out
+
+
+def _blend_cells(shape, layers, names, index_luts, palettes):
+    """逐格浮点混合各图层（code 组合过多时使用）"""
+    out = np.empty(shape + (4,), dtype=np.uint8)
+    out[..., 3] = 255
+    for r0 in range(0, shape[0], COMPOSITE_ROWS):
+        r1 = min(r0 + COMPOSITE_ROWS, shape[0])
+        rgb = np.empty((r1 - r0, shape[1], 3), dtype=np.float32)
+        rgb[:] = BACKGROUND_COLOR
+        for name, index, palette in zip(names, index_luts, palettes):
+            color = palette[index[layers[name].codes[r0:r1]]]
+            rgb += (color[..., :3] - rgb) * color[..., 3:]
+        out[r0:r1, :, :3] = np.clip(rgb + 0.5, 0, 255)
+    return out
+
+
+def build_mips(cells, levels):
+    """逐级 2x2 平均缩小，返回 [原图, 1/2, 1/4, ...]，共 levels 级"""
+    mips = [cells]
+    for _ in range(1, levels):
+        prev = mips[-1]
+        rows, cols = prev.shape[:2]
+        padded = np.zeros(((rows + 1) // 2 * 2, (cols + 1) // 2 * 2, 4), dtype=np.uint16)
+        padded[:rows, :cols] = prev
+        summed = padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+        summed += 2
+        summed //= 4
+        mips.append(summed.astype(np.uint8))
+    return mips
+
+
+def object_markers(map_data):
+    """对象标记列表 [(种类, x, y)]，坐标由 map_info.tilesize 单位换算为每格 TILE_PX"""
+    unit = TILE_PX / map_tilesize(map_data)
+    markers = []
+    for key, pos_key in OBJECT_POS_KEYS.items():
+        for obj in map_data.get(key) or []:
+            pos = obj.get(pos_key) if isinstance(obj, dict) else None
+            if isinstance(pos, (list, tuple)) and len(pos) == 2:
+                markers.append((key, float(pos[0]) * unit, float(pos[1]) * unit))
+    spawn = map_data.get('playerSpawn')
+    if isinstance(spawn, dict) and 'x' in spawn and 'y' in spawn:
+        markers.append(("spawn", float(spawn['x']) * unit, float(spawn['y']) * unit))
+    return markers
+
+
+def _shape_distance(kind, dx, dy):
+    """像素中心到标记边界的有向距离（内部为正），dx/dy 为相对标记中心的偏移"""
+    h = MARKER_HALF
+    if kind == "entity":
+        return h - np.hypot(dx, dy)
+    if kind == "enemy":
+        # 三角形 (0, -h) (h, h) (-h, h)：底边与两条斜边
+        norm = np.hypot(2.0, 1.0)
+        return np.minimum(h - dy, np.minimum((h - 2 * dx + dy) / norm, (h + 2 * dx + dy) / norm))
+    return np.minimum(h - np.abs(dx), h - np.abs(dy))
+
+
+def draw_markers(image, markers, px0, py0, pixels_per_world):
+    """在 image（左上角为全图像素 (px0, py0)）上绘制与之相交的对象标记"""
+    height, width = image.shape[:2]
+    reach = MARKER_HALF + 2
+    for kind, wx, wy in markers:
+        cx, cy = wx * pixels_per_world - px0, wy * pixels_per_world - py0
+        x0, x1 = max(int(cx) - reach, 0), min(int(cx) + reach + 1, width)
+        y0, y1 = max(int(cy) - reach, 0), min(int(cy) + reach + 1, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        dist = _shape_distance(kind, xs + 0.5 - cx, ys + 0.5 - cy)
+        window = image[y0:y1, x0:x1]
+        window[dist > 1, :3] = MARKER_COLORS[kind]
+        window[np.abs(dist) <= 1, :3] = OUTLINE_COLOR
+        window[dist >= -1, 3] = 255
+
+
+class Pyramid:
+    """瓦片金字塔的几何：层数、每层比例与瓦片数"""
+
+    def __init__(self, rows, cols, tile_px=TILE_PX_DEFAULT, tile_size=TILE_SIZE):
+        for value, name in ((tile_px, "tile_px"), (tile_size, "tile_size")):
+            if value < 1 or value & (value - 1):
+                raise ValueError(u"{} 必须是 2 的幂".format(name))
+        if tile_px > tile_size:
+            # 一块瓦片至少要覆盖一格，否则底层分块摘要不包含任何格子
+            raise ValueError(u"tile_px ({}) 不能大于 tile_size ({})".format(tile_px, tile_size))
+        self.rows, self.cols = rows, cols
+        self.tile_px = tile_px
+        self.tile_size = tile_size
+        span = max(rows, cols, 1) * tile_px
+        self.zmax = max(0, int(np.ceil(np.log2(span / float(tile_size)))))
+
+    def shift(self, z):
+        """第 z 层相对底层缩小的倍数（以 2 为底）"""
+        return self.zmax - z
+
+    def pixels_per_cell(self, z):
+        return self.tile_px / float(2 ** self.shift(z))
+
+    def level_size(self, z):
+        """第 z 层整图的像素尺寸 (宽, 高)"""
+        ppc = self.pixels_per_cell(z)
+        return int(np.ceil(self.cols * ppc)), int(np.ceil(self.rows * ppc))
+
+    def tile_count(self, z):
+        width, height = self.level_size(z)
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def cells_per_tile(self):
+        """底层一块瓦片覆盖的格子边长"""
+        return self.tile_size // self.tile_px
+
+    def mip_levels(self):
+        """需要的合成图缩小级数（每格不足 1 像素的层才用到）"""
+        return max(0, self.zmax - int(np.log2(self.tile_px))) + 1
+
+
+def render_pixels(mips, pyramid, z, px0, py0, width, height, markers):
+    """渲染第 z 层整图中 [px0, px0 + width) x [py0, py0 + height) 的像素，超出地图部分透明"""
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    ppc = pyramid.pixels_per_cell(z)
+    if ppc >= 1:
+        scale = int(ppc)
+        source = mips[0]
+        r0, c0 = py0 // scale, px0 // scale
+        r1, c1 = -(-(py0 + height) // scale), -(-(px0 + width) // scale)
+    else:
+        scale = 1
+        source = mips[int(round(np.log2(1.0 / ppc)))]
+        r0, c0, r1, c1 = py0, px0, py0 + height, px0 + width
+    block = source[r0:r1, c0:c1]
+    if scale > 1:
+        block = np.repeat(np.repeat(block, scale, axis=0), scale, axis=1)
+    oy, ox = py0 - r0 * scale, px0 - c0 * scale
+    block = block[oy:oy + height, ox:ox + width]
+    image[:block.shape[0], :block.shape[1]] = block
+    if markers:
+        draw_markers(image, markers, px0, py0, ppc / TILE_PX)
+    return image
+
+
+# 工作进程中的共享数据（fork 时直接继承，不需要序列化）
+_WORKER = {}
+
+
+def _init_worker(mips, pyramid, markers, out_dir):
+    _WORKER.update(mips=mips, pyramid=pyramid, markers=markers, out_dir=out_dir)
+
+
+def _render_tile(task):
+    """工作进程：渲染并写出一块瓦片"""
+    z, x, y = task
+    pyramid = _WORKER['pyramid']
+    size = pyramid.tile_size
+    image = render_pixels(_WORKER['mips'], pyramid, z, x * size, y * size, size, size, _WORKER['markers'])
+    path = os.path.join(_WORKER['out_dir'], str(z), str(x))
+    os.makedirs(path, exist_ok=True)
+    write_png(os.path.join(path, "{}.png".format(y)), image)
+    return task
+
+
+def _markers_by_tile(markers, pyramid, z):
+    """第 z 层每块瓦片相交的对象标记 {(x, y): [标记]}"""
+    ppw = pyramid.pixels_per_cell(z) / TILE_PX
+    reach = MARKER_HALF + 2
+    size = pyramid.tile_size
+    found = {}
+    for marker in markers:
+        cx, cy = marker[1] * ppw, marker[2] * ppw
+        for tx in range(max(int(cx - reach) // size, 0), int(cx + reach) // size + 1):
+            for ty in range(max(int(cy - reach) // size, 0), int(cy + reach) // size + 1):
+                found.setdefault((tx, ty), []).append(marker)
+    return found
+
+
+def tile_digests(layers, names, pyramid, markers, options):
+    """每块瓦片的内容摘要 {"z/x/y": sha1}
+
+    底层按块对各可见图层的编码与块内对象求摘要，上层由四块子瓦片的摘要与本块对象合成。
+    """
+    seed = json.dumps(options, sort_keys=True).encode('utf-8')
+    cpt = pyramid.cells_per_tile()
+    digests = {}
+    z = pyramid.zmax
+    nx, ny = pyramid.tile_count(z)
+    marked = _markers_by_tile(markers, pyramid, z)
+    for y in range(ny):
+        for x in range(nx):
+            h = hashlib.sha1(seed)
+            for name in names:
+                h.update(np.ascontiguousarray(layers[name].codes[y * cpt:(y + 1) * cpt, x * cpt:(x + 1) * cpt]).tobytes())
+            h.update(repr(marked.get((x, y), [])).encode('utf-8'))
+            digests["{}/{}/{}".format(z, x, y)] = h.hexdigest()
+    for z in range(pyramid.zmax - 1, -1, -1):
+        nx, ny = pyramid.tile_count(z)
+        marked = _markers_by_tile(markers, pyramid, z)
+        for y in range(ny):
+            for x in range(nx):
+                h = hashlib.sha1(seed)
+                for cy in (2 * y, 2 * y + 1):
+                    for cx in (2 * x, 2 * x + 1):
+                        h.update(digests.get("{}/{}/{}".format(z + 1, cx, cy), "-").encode('ascii'))
+                h.update(repr(marked.get((x, y), [])).encode('utf-8'))
+                digests["{}/{}/{}".format(z, x, y)] = h.hexdigest()
+    return digests
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def export_map(map_data, layers, out_dir, tile_px=TILE_PX_DEFAULT, tile_size=TILE_SIZE, markers=True,
+               names=None, jobs=None, overview_size=OVERVIEW_SIZE, force=False):
+    """导出瓦片金字塔与总览图，返回统计 {"rendered", "skipped", "removed", "levels"}
+
+    names 为参与绘制的图层（缺省为文件中设为可见的图层）。
+    """
+    terrain = layers[TERRAIN].codes
+    pyramid = Pyramid(terrain.shape[0], terrain.shape[1], tile_px, tile_size)
+    if names is None:
+        names = [name for name in LAYER_NAMES if layers[name].visible]
+    names = [name for name in LAYER_NAMES if name in names]
+    marks = object_markers(map_data) if markers else []
+    options = {"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "tile_px": tile_px, "tile_size": tile_size,
+               "layers": [[name, layers[name].opacity] for name in names], "shape": list(terrain.shape)}
+
+    digests = tile_digests(layers, names, pyramid, marks, options)
+    manifest = load_manifest(out_dir)
+    old = {} if force else manifest.get('tiles', {})
+    todo = [key for key, digest in digests.items()
+            if old.get(key) != digest or not os.path.exists(os.path.join(out_dir, key + ".png"))]
+
+    # 总览图：长边不超过 overview_size 的最大一层
+    z = pyramid.zmax
+    while z > 0 and max(pyramid.level_size(z)) > overview_size:
+        z -= 1
+    overview_path = os.path.join(out_dir, "overview.png")
+    redraw_overview = bool(todo) or not os.path.exists(overview_path) or manifest.get('overview_level') != z
+
+    # 合成与逐级缩小只做一次，工作进程共享
+    mips = None
+    if todo or redraw_overview:
+        mips = build_mips(composite_cells(layers, names), pyramid.mip_levels())
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [tuple(int(v) for v in key.split("/")) for key in todo]
+    if tasks:
+        if jobs == 1 or len(tasks) == 1:
+            _init_worker(mips, pyramid, marks, out_dir)
+            for task in tasks:
+                _render_tile(task)
+        else:
+            # 优先 fork，工作进程直接继承合成图而不必逐个序列化
+            context = None
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=jobs, mp_context=context, initializer=_init_worker,
+                    initargs=(mips, pyramid, marks, out_dir)) as pool:
+                for _ in pool.map(_render_tile, tasks, chunksize=max(1, len(tasks) // ((jobs or os.cpu_count() or 1) * 8))):
+                    pass
+
+    # 尺寸变小后不再存在的瓦片
+    removed = 0
+    for key in set(manifest.get('tiles', {})) - set(digests):
+        path = os.path.join(out_dir, key + ".png")
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+
+    if redraw_overview:
+        width, height = pyramid.level_size(z)
+        write_png(overview_path, render_pixels(mips, pyramid, z, 0, 0, width, height, marks))
+
+    manifest = dict(options, zmax=pyramid.zmax, overview_level=z, tiles=digests)
+    with open(os.path.join(out_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    return {"rendered": len(todo), "skipped": len(digests) - len(todo), "removed": removed, "levels": pyramid.zmax + 1}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=u"导出地图瓦片金字塔与总览图")
+    parser.add_argument("map", help=u"地图 JSON")
+    parser.add_argument("-o", "--output", help=u"输出目录，缺省为 export/<地图名>")
+    parser.add_argument("--tile-px", type=int, default=TILE_PX_DEFAULT, help=u"底层每格像素数（2 的幂）")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help=u"瓦片边长（像素，2 的幂）")
+    parser.add_argument("--layers", help=u"参与绘制的图层，逗号分隔；缺省为文件中可见的图层")
+    parser.add_argument("--no-markers", action="store_true", help=u"不绘制实体/敌人/生成点")
+    parser.add_argument("--jobs", type=int, help=u"并行进程数，缺省为 CPU 核数")
+    parser.add_argument("--overview-size", type=int, default=OVERVIEW_SIZE, help=u"总览图长边上限（像素）")
+    parser.add_argument("--force", action="store_true", help=u"忽略摘要，全部重新渲染")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.map)), CACHE_DIRNAME)
+    map_data, grids, _ = read_map(args.map, cache_dir)
+    layers, _ = build_layers(map_data, grids)
+    names = None
+    if args.layers:
+        names = [name.strip() for name in args.layers.split(",") if name.strip()]
+        unknown = [name for name in names if name not in LAYER_NAMES]
+        if unknown:
+            print(u"未知图层: {}（可选 {}）".format(", ".join(unknown), ", ".join(LAYER_NAMES)))
+            return 2
+    out_dir = args.output or os.path.join("export", os.path.splitext(os.path.basename(args.map))[0])
+    try:
+        stats = export_map(map_data, layers, out_dir, args.tile_px, args.tile_size, not args.no_markers,
+                           names, args.jobs, args.overview_size, args.force)
+    except ValueError as e:
+        print(u"导出失败: {}".format(e))
+        return 1
+    print(u"{}: {} 层，渲染 {} 块，未变化 {} 块，删除 {} 块，耗时 {:.2f}s".format(
+        out_dir, stats['levels'], stats['rendered'], stats['skipped'], stats['removed'],
+        time.perf_counter() - started))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
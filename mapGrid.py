@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+地图数据与 NumPy 编码网格之间的转换、读取与流式写出
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+# 编码网格的数据类型（地砖 code 不超过 65535）
+CODE_DTYPE = np.uint16
+
+# 写出格式：每格写完整的地砖信息（与 save_map 一致），或只写地砖 code
+CELL_TILE = "tile"
+CELL_CODE = "code"
+
+# 编辑器中每格的像素数（缩放 100% 时）
+TILE_PX = 40
+
+# 对象坐标以 map_info.tilesize 为每格单位；map_info 缺失或无效时按此值
+DEFAULT_TILESIZE = 100
+
+# 对象列表与其坐标字段：实体用 position，敌人用 spawn
+OBJECT_POS_KEYS = {"entity": "position", "enemy": "spawn"}
+
+# 顶层字段的写出顺序，与 mapDesigner.py 原有的 mapData 保持一致
+MAP_KEYS = ("name", "playerSpawn", "enemy", "tile_info", "map_info", "map", "entity")
+
+
+def cell_code(cell, default=1):
+    """取单个格子的地砖 code（兼容 dict 与纯数字两种写法）"""
+    if isinstance(cell, dict):
+        return int(cell.get('code', default))
+    return int(cell)
+
+
+def codes_from_rows(rows, default=1):
+    """将 map 字段（行列表）转换为二维编码数组，参差的行以 default 补齐"""
+    if not rows:
+        return np.zeros((0, 0), dtype=CODE_DTYPE)
+    width = max(len(row) for row in rows)
+    codes = np.full((len(rows), width), default, dtype=CODE_DTYPE)
+    for r, row in enumerate(rows):
+        if not any(isinstance(c, dict) for c in row):
+            codes[r, :len(row)] = row
+        else:
+            codes[r, :len(row)] = [cell_code(c, default) for c in row]
+    return codes
+
+
+def ragged_rows(rows):
+    """长度与最长行不一致的行，返回 [[行号, 长度], ...]"""
+    if not rows:
+        return []
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    bad = np.flatnonzero(lengths != lengths.max())
+    return [[int(r), int(lengths[r])] for r in bad]
+
+
+def cell_format_of(rows):
+    """根据 map 字段判断原文件的格子写法"""
+    if rows and rows[0] and isinstance(rows[0][0], dict):
+        return CELL_TILE
+    return CELL_CODE
+
+
+def codes_from_map(map_data, default=1):
+    """从地图数据中取出编码网格"""
+    return codes_from_rows(map_data.get('map', []), default)
+
+
+def load_map_file(filepath):
+    """读取地图 JSON，返回 (地图数据, 编码网格)，地图数据中不再保留 map 字段"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        map_data = json.load(f)
+    codes = codes_from_map(map_data)
+    map_data.pop('map', None)
+    return map_data, codes
+
+
+def label_regions(mask):
+    """4 连通区域标记，返回与 mask 同形的标签数组（-1 表示不在 mask 内）
+
+    先把每行连续的格子合成行程，再在上下相邻的行程之间做并查集式的
+    最小标签传播 + 指针跳跃，全部以数组运算完成。
+    """
+    rows, cols = mask.shape
+    flat = mask.ravel()
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    run_id = np.cumsum(starts.ravel()) - 1
+    n_runs = int(starts.sum())
+    labels = np.full(mask.size, -1, dtype=np.int64)
+    if n_runs == 0:
+        return labels.reshape(rows, cols)
+
+    # 上下相邻的行程对；按扫描顺序两端的行程号都不递减，去掉连续重复即可
+    idx = np.flatnonzero((mask[:-1] & mask[1:]).ravel())
+    a = run_id[idx]
+    b = run_id[idx + cols]
+    keep = np.ones(a.size, dtype=bool)
+    keep[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b = a[keep], b[keep]
+
+    # 把较大的根挂到较小的根上，再做完整的路径压缩，直到所有边两端同根
+    parent = np.arange(n_runs)
+    while a.size:
+        pa, pb = parent[a], parent[b]
+        diff = pa != pb
+        if not diff.any():
+            break
+        a, b, pa, pb = a[diff], b[diff], pa[diff], pb[diff]
+        parent[np.maximum(pa, pb)] = np.minimum(pa, pb)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    _, comp = np.unique(parent, return_inverse=True)
+    labels[flat] = comp[run_id[flat]]
+    return labels.reshape(rows, cols)
+
+
+def grid_digest(codes):
+    """编码网格的内容摘要（含形状）"""
+    h = hashlib.sha1("{}x{}".format(*codes.shape).encode('ascii'))
+    h.update(np.ascontiguousarray(codes, dtype=CODE_DTYPE).tobytes())
+    return h.hexdigest()
+
+
+def map_tilesize(map_data):
+    """对象坐标每格的单位数（map_info.tilesize）
+
+    编辑器与导出工具按此换算：世界坐标 = 像素 / TILE_PX x tilesize。
+    """
+    info = map_data.get('map_info')
+    tilesize = info.get('tilesize') if isinstance(info, dict) else None
+    if isinstance(tilesize, bool) or not isinstance(tilesize, (int, float)) or tilesize <= 0:
+        return DEFAULT_TILESIZE
+    return tilesize
+
+
+def map_info_for(codes, tilesize=DEFAULT_TILESIZE):
+    """根据网格大小生成 map_info"""
+    rows, cols = codes.shape
+    return {
+        "height": rows * tilesize,
+        "width": cols * tilesize,
+        "tilesize": tilesize
+    }
+
+
+def _cell_lut(codes, tile_info, cell_format):
+    """为网格中出现的每个 code 预先序列化好单元格文本，按 code 下标查表"""
+    lut = np.empty(int(codes.max()) + 1 if codes.size else 1, dtype=object)
+    lut[:] = None
+    for code in np.unique(codes):
+        code = int(code)
+        info = tile_info.get(str(code), tile_info.get(code))
+        if cell_format == CELL_TILE and info is not None:
+            lut[code] = json.dumps(info, ensure_ascii=False, separators=(',', ':'))
+        else:
+            lut[code] = str(code)
+    return lut
+
+
+def _write_rows(f, codes, lut):
+    """逐行写出网格"""
+    f.write("[\n")
+    last = len(codes) - 1
+    for r, row in enumerate(codes):
+        f.write("[")
+        f.write(",".join(lut[row]))
+        f.write("],\n" if r < last else "]\n")
+    f.write("]")
+
+
+def write_map(filepath, map_data, codes, cell_format=CELL_TILE, layer_grids=None):
+    """流式写出地图 JSON：元数据一次写出，网格逐行查表拼接，避免构造千万级 dict
+
+    layer_grids 为 {图层名: 编码网格}，写入 map_data['layers'] 对应条目的 map 字段（只写 code）。
+    """
+    tile_info = map_data.get('tile_info', {})
+    lut = _cell_lut(codes, tile_info, cell_format)
+    keys = [k for k in MAP_KEYS if k in map_data or k == 'map']
+    keys += [k for k in map_data if k not in keys]
+    layer_grids = layer_grids or {}
+
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("{\n")
+        for i, key in enumerate(keys):
+            f.write(json.dumps(key))
+            f.write(": ")
+            if key == 'map':
+                _write_rows(f, codes, lut)
+            elif key == 'layers' and layer_grids:
+                f.write("{\n")
+                names = list(map_data['layers'])
+                for j, name in enumerate(names):
+                    meta = dict(map_data['layers'][name])
+                    f.write(json.dumps(name))
+                    f.write(": ")
+                    if name in layer_grids:
+                        f.write(json.dumps(meta, ensure_ascii=False)[:-1])
+                        f.write(', "map": ')
+                        grid = layer_grids[name]
+                        _write_rows(f, grid, _cell_lut(grid, {}, CELL_CODE))
+                        f.write("}")
+                    else:
+                        f.write(json.dumps(meta, ensure_ascii=False))
+                    f.write(",\n" if j < len(names) - 1 else "\n")
+                f.write("}")
+            else:
+                f.write(json.dumps(map_data[key], ensure_ascii=False))
+            f.write(",\n" if i < len(keys) - 1 else "\n")
+        f.write("}\n")
+    os.replace(tmp_path, filepath)
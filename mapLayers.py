@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+多图层地图
+
+图层固定为 background / terrain / foreground / collision 四层，每层是一张编码网格，
+并引用一个调色板（tile_info 或 palettes 中的条目）。terrain 层即原有的顶层 map 字段，
+其余图层写在 layers 字段中；旧的单层文件读取时自动补出其余图层：
+装饰层为空，碰撞层由 terrain 地砖的 walkable / upThroughable 推导。
+
+文件中的写法：
+    "palettes": {"collision": {...}},
+    "layers": {
+        "background": {"palette": "tile_info", "visible": true, "opacity": 1.0, "map": [[...]]},
+        "terrain": {"palette": "tile_info", "visible": true, "opacity": 1.0},
+        ...
+    }
+"""
+import numpy as np
+
+from mapGrid import CODE_DTYPE, codes_from_rows
+
+
+BACKGROUND = "background"
+TERRAIN = "terrain"
+FOREGROUND = "foreground"
+COLLISION = "collision"
+
+# 自下而上的绘制顺序
+LAYER_NAMES = (BACKGROUND, TERRAIN, FOREGROUND, COLLISION)
+
+# 非 terrain 图层中表示"空"的 code
+EMPTY_CODE = 0
+
+# 碰撞层调色板
+COLLISION_NONE = 0
+COLLISION_SOLID = 1
+COLLISION_ONE_WAY = 2
+COLLISION_PALETTE = {
+    "0": {"code": 0, "name": "none"},
+    "1": {"code": 1, "name": "solid"},
+    "2": {"code": 2, "name": "one_way"},
+}
+
+# 绘制用颜色 (r, g, b)，未列出的 code 用 TILE_DEFAULT_COLOR
+TILE_COLORS = {1: (80, 80, 80), 2: (150, 150, 150)}
+TILE_DEFAULT_COLOR = (120, 120, 120)
+COLLISION_COLORS = {COLLISION_SOLID: (220, 60, 60), COLLISION_ONE_WAY: (230, 200, 60)}
+
+DEFAULT_LAYER_META = {
+    BACKGROUND: {"palette": "tile_info", "visible": True, "opacity": 1.0},
+    TERRAIN: {"palette": "tile_info", "visible": True, "opacity": 1.0},
+    FOREGROUND: {"palette": "tile_info", "visible": True, "opacity": 0.8},
+    COLLISION: {"palette": "collision", "visible": False, "opacity": 0.5},
+}
+
+
+class Layer:
+    """一个图层：编码网格 + 调色板引用 + 显示状态
+
+    persist 为假的图层（旧文件补出的空层、推导出的碰撞层）在未被编辑前不会写回文件。
+    """
+
+    def __init__(self, name, codes, palette="tile_info", visible=True, opacity=1.0, persist=True):
+        self.name = name
+        self.codes = codes
+        self.palette = palette
+        self.visible = visible
+        self.opacity = opacity
+        self.persist = persist
+
+    def meta(self):
+        return {"palette": self.palette, "visible": self.visible, "opacity": self.opacity}
+
+
+def layer_rgba(name, code):
+    """图层中某个 code 的绘制颜色 (r, g, b, a)；非 terrain 图层的空 code 透明"""
+    if name != TERRAIN and code == EMPTY_CODE:
+        return 0, 0, 0, 0
+    if name == COLLISION:
+        return COLLISION_COLORS.get(code, TILE_DEFAULT_COLOR) + (255,)
+    return TILE_COLORS.get(code, TILE_DEFAULT_COLOR) + (255,)
+
+
+def extract_layer_grids(map_data):
+    """从 map_data['layers'] 中取出各层网格（转为编码数组），只留下元数据"""
+    grids = {}
+    for name, meta in (map_data.get('layers') or {}).items():
+        if isinstance(meta, dict) and 'map' in meta:
+            grids[name] = codes_from_rows(meta.pop('map'), EMPTY_CODE)
+    return grids
+
+
+def derive_collision(tile_info, codes):
+    """由 terrain 地砖属性推导碰撞层：walkable 为实心，upThroughable 为单向平台"""
+    size = int(codes.max()) + 1 if codes.size else 1
+    lut = np.zeros(max(size, 1), dtype=CODE_DTYPE)
+    for key, info in tile_info.items():
+        code = int(key)
+        if code >= size or not isinstance(info, dict):
+            continue
+        if info.get('upThroughable'):
+            lut[code] = COLLISION_ONE_WAY
+        elif info.get('walkable'):
+            lut[code] = COLLISION_SOLID
+    return lut[codes]
+
+
+def refresh_collision(map_data, layers, rect=None):
+    """碰撞层未被编辑过（仍由 terrain 推导）时，按当前 terrain 重新推导 rect 范围（缺省全部）
+
+    返回是否更新了碰撞层；已编辑过的碰撞层保持不变。
+    """
+    collision = layers.get(COLLISION)
+    if collision is None or collision.persist:
+        return False
+    terrain = layers[TERRAIN].codes
+    r0, c0, r1, c1 = rect if rect is not None else (0, 0) + terrain.shape
+    collision.codes[r0:r1, c0:c1] = derive_collision(map_data.get('tile_info', {}), terrain[r0:r1, c0:c1])
+    return True
+
+
+def _fit(codes, shape):
+    """把图层网格裁剪/补齐到 terrain 的尺寸"""
+    if codes.shape == shape:
+        return codes
+    fitted = np.full(shape, EMPTY_CODE, dtype=CODE_DTYPE)
+    rows = min(codes.shape[0], shape[0])
+    cols = min(codes.shape[1], shape[1])
+    fitted[:rows, :cols] = codes[:rows, :cols]
+    return fitted
+
+
+def build_layers(map_data, grids):
+    """由地图数据和网格构造全部图层，返回 ({名称: Layer}, 尺寸不符的图层名列表)
+
+    grids 至少包含 terrain；map_data['layers'] 中只保留元数据。
+    """
+    terrain = grids[TERRAIN]
+    metas = map_data.get('layers') or {}
+    layers = {}
+    mismatched = []
+    for name in LAYER_NAMES:
+        meta = dict(DEFAULT_LAYER_META[name])
+        meta.update({k: v for k, v in (metas.get(name) or {}).items() if k in meta})
+        if name == TERRAIN:
+            codes, persist = terrain, True
+        elif name in grids:
+            codes, persist = grids[name], True
+            if codes.shape != terrain.shape:
+                mismatched.append(name)
+                codes = _fit(codes, terrain.shape)
+        elif name == COLLISION:
+            codes, persist = derive_collision(map_data.get('tile_info', {}), terrain), False
+        else:
+            codes, persist = np.full(terrain.shape, EMPTY_CODE, dtype=CODE_DTYPE), False
+        layers[name] = Layer(name, codes, meta['palette'], bool(meta['visible']),
+                             float(meta['opacity']), persist)
+    return layers, mismatched
+
+
+def palette_named(map_data, palette):
+    """按名称取调色板 {code 字符串: 地砖信息}：tile_info 或 palettes 中的条目"""
+    if palette == "tile_info":
+        return map_data.get('tile_info', {})
+    palettes = map_data.get('palettes') or {}
+    if palette in palettes:
+        return palettes[palette]
+    if palette == "collision":
+        return COLLISION_PALETTE
+    return {}
+
+
+def palette_for(map_data, layer):
+    """图层引用的调色板"""
+    return palette_named(map_data, layer.palette)
+
+
+def prepare_for_write(map_data, layers):
+    """根据图层更新 map_data 中的 layers / palettes 元数据，返回需要写出的图层网格
+
+    只有存在需要持久化的非 terrain 图层时才写 layers 字段，旧的单层文件保存后格式不变。
+    """
+    extra = {name: layer.codes for name, layer in layers.items() if name != TERRAIN and layer.persist}
+    if not extra:
+        map_data.pop('layers', None)
+        return {}
+    map_data['layers'] = {name: layer.meta() for name, layer in layers.items()
+                          if name == TERRAIN or name in extra}
+    if any(layers[name].palette == "collision" for name in extra):
+        map_data.setdefault('palettes', {}).setdefault("collision", COLLISION_PALETTE)
+    return extra
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+编辑器到游戏的实时推送
+
+编辑器开启推送后在本机监听 TCP 端口，游戏作为客户端连接。消息为一行一个 JSON：
+
+    {"t": "snapshot", "seq": 0, "map": {...}, "layers": {"terrain": {"shape": [h, w], "codes": "..."}, ...}}
+    {"t": "delta", "seq": 5, "tiles": [[图层, r0, c0, r1, c1, "..."], ...], "enemy": [...], "playerSpawn": {...}}
+
+codes 为 zlib 压缩的小端 uint16 网格再做 base64（与图章库相同）。delta 中的地砖与对象都是
+修改后的完整值，重复应用没有副作用；对象以整个列表替换。seq 按连接递增，客户端发现
+跳号时发送 {"t": "resync"} 重新获取快照，新连接总是先收到快照。
+
+    python3 mapLive.py client [--port 47800]            # 参考客户端：应用消息并打印延迟
+    python3 mapLive.py serve start_cave.json [--demo]   # 替身服务端：不开编辑器也能测试游戏端
+"""
+import argparse
+import base64
+import copy
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from mapGrid import OBJECT_POS_KEYS, load_map_file
+from mapLayers import TERRAIN, build_layers, extract_layer_grids
+
+
+LIVE_HOST = "127.0.0.1"
+LIVE_PORT = 47800
+PROTOCOL_VERSION = 1
+
+# 一帧内同一图层的修改矩形超过此数量时合并为外接矩形
+MAX_RECTS = 16
+
+# 压缩级别：实时推送更看重编码速度
+ZLIB_LEVEL = 1
+
+# 每个连接最多排队的消息数与单次发送的超时（秒）：超出时断开该连接，重连后重新同步
+CLIENT_QUEUE = 256
+SEND_TIMEOUT = 2.0
+
+# 对象类修改：实体、敌人列表与玩家生成点
+OBJECT_KINDS = tuple(OBJECT_POS_KEYS) + ("playerSpawn",)
+
+
+def encode_codes(codes):
+    raw = np.ascontiguousarray(codes, dtype='<u2').tobytes()
+    return base64.b64encode(zlib.compress(raw, ZLIB_LEVEL)).decode('ascii')
+
+
+def decode_codes(text, height, width):
+    raw = zlib.decompress(base64.b64decode(text))
+    return np.frombuffer(raw, dtype='<u2').reshape(height, width).copy()
+
+
+def encode_message(msg):
+    return (json.dumps(msg, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def _stamp(body, seq):
+    """在已编码的消息前补上 seq 与发送时间（消息体只编码一次，各连接共用）"""
+    return '{{"seq":{},"time":{:.6f},'.format(seq, time.time()).encode('ascii') + body[1:]
+
+
+def snapshot_state(map_data, layers):
+    """快照所需数据的副本：(地图字段, {图层名: (元数据, 编码网格)})，之后可在其他线程编码"""
+    return copy.deepcopy(map_data), {name: (layer.meta(), layer.codes.copy()) for name, layer in layers.items()}
+
+
+def snapshot_message(state):
+    """完整快照：地图字段与全部图层"""
+    map_data, grids = state
+    return {
+        "t": "snapshot",
+        "v": PROTOCOL_VERSION,
+        "map": map_data,
+        "layers": {name: dict(meta, shape=list(codes.shape), codes=encode_codes(codes))
+                   for name, (meta, codes) in grids.items()},
+    }
+
+
+def _union(rects):
+    r0 = min(r[0] for r in rects)
+    c0 = min(r[1] for r in rects)
+    return r0, c0, max(r[2] for r in rects), max(r[3] for r in rects)
+
+
+class DeltaBuffer:
+    """收集一帧内的修改，取出时合并为一条 delta 消息"""
+
+    def __init__(self):
+        self.rects = {}
+        self.objects = set()
+
+    def mark_tiles(self, layer, rect):
+        r0, c0, r1, c1 = rect
+        if r0 < r1 and c0 < c1:
+            self.rects.setdefault(layer, []).append((r0, c0, r1, c1))
+
+    def mark_objects(self, *kinds):
+        self.objects.update(kinds or OBJECT_KINDS)
+
+    def clear(self):
+        self.rects.clear()
+        self.objects.clear()
+
+    def __bool__(self):
+        return bool(self.rects or self.objects)
+
+    def take(self, map_data, layers):
+        """按当前数据生成 delta 消息并清空；没有修改时返回 None"""
+        if not self:
+            return None
+        tiles = []
+        for name, rects in self.rects.items():
+            if len(rects) > MAX_RECTS:
+                rects = [_union(rects)]
+            codes = layers[name].codes
+            for r0, c0, r1, c1 in dict.fromkeys(rects):
+                tiles.append([name, r0, c0, r1, c1, encode_codes(codes[r0:r1, c0:c1])])
+        msg = {"t": "delta", "tiles": tiles}
+        for kind in self.objects:
+            msg[kind] = map_data.get(kind)
+        self.clear()
+        return msg
+
+
+class _Snapshot:
+    """一批待快照连接共用的快照：数据在调用线程中复制，由第一个发送线程编码"""
+
+    def __init__(self, state):
+        self.state = state
+        self.encoded = None
+        self.lock = threading.Lock()
+
+    def body(self):
+        with self.lock:
+            if self.encoded is None:
+                self.encoded = encode_message(snapshot_message(self.state))
+                self.state = None
+            return self.encoded
+
+
+class _Client:
+    """一个游戏连接：自己的发送队列与发送线程，互不阻塞"""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.seq = 0
+        self.live = False
+        self.outbox = queue.Queue(CLIENT_QUEUE)
+
+
+class LiveServer:
+    """本机推送服务：接受游戏连接，每个连接由自己的线程发送消息，不阻塞界面线程
+
+    新连接（以及请求重新同步的连接）进入待快照列表，由调用方取出后发送快照；
+    在快照排队之前，广播的 delta 不会发给该连接。大地图的快照编码较慢，在发送线程中进行。
+    发送队列已满或发送超时的连接（游戏卡住、不再读取）直接断开，重连后重新获取快照。
+    """
+
+    def __init__(self, host=LIVE_HOST, port=LIVE_PORT):
+        self.host = host
+        self.port = port
+        self.clients = []
+        self.waiting = []
+        self.lock = threading.Lock()
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self._drop(client)
+
+    def client_count(self):
+        with self.lock:
+            return len(self.clients)
+
+    def take_waiting(self):
+        """取出需要快照的连接"""
+        with self.lock:
+            waiting, self.waiting = self.waiting, []
+        return waiting
+
+    def resync_all(self):
+        """所有连接重新获取快照（如切换了地图）"""
+        with self.lock:
+            for client in self.clients:
+                client.live = False
+            self.waiting = list(self.clients)
+
+    def send_snapshot(self, clients, map_data, layers):
+        """给 clients 发送快照：调用线程中复制数据，发送线程中编码"""
+        snapshot = _Snapshot(snapshot_state(map_data, layers))
+        for client in clients:
+            client.live = True
+            self._enqueue(client, snapshot)
+
+    def broadcast(self, msg):
+        """消息在调用线程中编码，之后修改地图数据不影响已排队的消息"""
+        body = encode_message(msg)
+        with self.lock:
+            clients = [c for c in self.clients if c.live]
+        for client in clients:
+            self._enqueue(client, body)
+
+    def _enqueue(self, client, item):
+        try:
+            client.outbox.put_nowait(item)
+        except queue.Full:
+            self._drop(client)
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, addr = self.sock.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(SEND_TIMEOUT)
+            client = _Client(sock, addr)
+            with self.lock:
+                self.clients.append(client)
+                self.waiting.append(client)
+            threading.Thread(target=self._read_loop, args=(client,), daemon=True).start()
+            threading.Thread(target=self._send_loop, args=(client,), daemon=True).start()
+
+    def _read_loop(self, client):
+        """读取客户端请求：目前只有 resync（套接字带发送超时，读取超时时继续等待）"""
+        pending = b""
+        while True:
+            try:
+                data = client.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if request.get('t') == "resync":
+                    with self.lock:
+                        client.live = False
+                        if client in self.clients and client not in self.waiting:
+                            self.waiting.append(client)
+        self._drop(client)
+
+    def _send_loop(self, client):
+        while True:
+            item = client.outbox.get()
+            if item is None:
+                break
+            if isinstance(item, _Snapshot):
+                client.seq = 0
+                body = item.body()
+            else:
+                client.seq += 1
+                body = item
+            try:
+                client.sock.sendall(_stamp(body, client.seq))
+            except OSError:
+                self._drop(client)
+                break
+
+    def _drop(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            if client in self.waiting:
+                self.waiting.remove(client)
+        client.live = False
+        try:
+            client.outbox.put_nowait(None)
+        except queue.Full:
+            # 发送线程正卡在 sendall 上，关闭套接字后会出错退出
+            pass
+        try:
+            client.sock.close()
+        except OSError:
+            pass
+
+
+class LiveClient:
+    """参考客户端：维护一份地图副本并应用收到的消息（游戏端可照此实现）"""
+
+    def __init__(self, host=LIVE_HOST, port=LIVE_PORT):
+        self.host = host
+        self.port = port
+        self.map_data = None
+        self.layers = {}
+        self.seq = None
+        self.sock = None
+
+    def apply(self, msg):
+        """应用一条消息；跳号时请求重新同步并忽略该消息，返回是否已应用"""
+        if msg.get('t') == "snapshot":
+            self.map_data = msg['map']
+            self.layers = {name: decode_codes(info['codes'], *info['shape'])
+                           for name, info in msg['layers'].items()}
+            self.seq = msg['seq']
+            return True
+        if self.seq is None or msg.get('seq') != self.seq + 1:
+            self.request_resync()
+            return False
+        self.seq = msg['seq']
+        for name, r0, c0, r1, c1, text in msg.get('tiles', []):
+            self.layers[name][r0:r1, c0:c1] = decode_codes(text, r1 - r0, c1 - c0)
+        for kind in OBJECT_KINDS:
+            if kind in msg:
+                self.map_data[kind] = msg[kind]
+        return True
+
+    def request_resync(self):
+        self.seq = None
+        if self.sock is not None:
+            self.sock.sendall(encode_message({"t": "resync"}))
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.seq = None
+
+    def messages(self):
+        """逐条读取消息，连接断开时结束"""
+        for line in self.sock.makefile('rb'):
+            yield json.loads(line)
+
+    def run(self, on_message=None, reconnect=True):
+        """连接并持续应用消息；断线后自动重连（重连后会收到新的快照）"""
+        while True:
+            try:
+                self.connect()
+                for msg in self.messages():
+                    applied = self.apply(msg)
+                    if on_message is not None:
+                        on_message(self, msg, applied)
+            except OSError:
+                pass
+            if not reconnect:
+                return
+            time.sleep(1.0)
+
+
+def _describe(client, msg, applied):
+    """参考客户端的输出：消息类型、大小与传输延迟"""
+    delay = (time.time() - msg.get('time', time.time())) * 1000
+    if msg['t'] == "snapshot":
+        shape = client.layers[TERRAIN].shape if TERRAIN in client.layers else (0, 0)
+        print(u"快照 seq={} {}x{}，{} 个图层，延迟 {:.1f} ms".format(
+            msg['seq'], shape[1], shape[0], len(client.layers), delay))
+    else:
+        cells = sum((t[3] - t[1]) * (t[4] - t[2]) for t in msg.get('tiles', []))
+        kinds = [k for k in OBJECT_KINDS if k in msg]
+        print(u"增量 seq={}{}：{} 格{}，延迟 {:.1f} ms".format(
+            msg.get('seq'), u"" if applied else u"（跳号，请求重新同步）", cells,
+            u"，对象 " + "/".join(kinds) if kinds else u"", delay))
+    sys.stdout.flush()
+
+
+def serve_file(filepath, host, port, demo=False):
+    """替身服务端：向连接的客户端提供地图文件的快照；demo 时每秒随机翻转一格地砖"""
+    map_data, codes = load_map_file(filepath)
+    grids = extract_layer_grids(map_data)
+    grids[TERRAIN] = codes
+    layers, _ = build_layers(map_data, grids)
+    server = LiveServer(host, port)
+    server.start()
+    print(u"正在 {}:{} 上提供 {}".format(server.host, server.port, filepath))
+    rng = np.random.default_rng()
+    buffer = DeltaBuffer()
+    last_demo = time.time()
+    try:
+        while True:
+            waiting = server.take_waiting()
+            if waiting:
+                server.send_snapshot(waiting, map_data, layers)
+            if demo and time.time() - last_demo >= 1.0 and codes.size:
+                last_demo = time.time()
+                r, c = int(rng.integers(codes.shape[0])), int(rng.integers(codes.shape[1]))
+                codes[r, c] = 1 if codes[r, c] == 2 else 2
+                buffer.mark_tiles(TERRAIN, (r, c, r + 1, c + 1))
+            msg = buffer.take(map_data, layers)
+            if msg is not None:
+                server.broadcast(msg)
+            time.sleep(1 / 60.0)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=u"编辑器到游戏的实时推送")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_client = sub.add_parser("client", help=u"参考客户端")
+    p_serve = sub.add_parser("serve", help=u"替身服务端")
+    p_serve.add_argument("map", help=u"地图 JSON")
+    p_serve.add_argument("--demo", action="store_true", help=u"每秒随机修改一格地砖")
+    for p in (p_client, p_serve):
+        p.add_argument("--host", default=LIVE_HOST)
+        p.add_argument("--port", type=int, default=LIVE_PORT)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        return serve_file(args.map, args.host, args.port, args.demo)
+    try:
+        LiveClient(args.host, args.port).run(_describe)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
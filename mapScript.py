@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+地图脚本接口
+
+在编辑器的脚本控制台中，或在命令行中对地图批量修改：
+
+    python3 mapScript.py start_cave.json edit.py [-o out.json] [--dry-run]
+
+脚本中可用的名字：m（MapScript 对象）、np（numpy）。例：
+
+    m.replace(2, 3, rect=(0, 0, 20, 40))              # 矩形内 code 2 换成 3
+    m.add_enemies(m.scatter(m.floor_mask(), 200), id=2)  # 在地面上撒 200 个敌人
+    m.translate("entity", 100, 0)                      # 所有实体右移 100
+
+所有操作都是整块数组运算；一次脚本运行作为一次修改（一条撤销记录），出错时整体回滚。
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from mapGrid import (
+    CELL_CODE, CELL_TILE, CODE_DTYPE, OBJECT_POS_KEYS, cell_format_of, codes_from_rows, map_tilesize, write_map
+)
+from mapLayers import TERRAIN, build_layers, extract_layer_grids, palette_named, prepare_for_write
+from mapStamps import object_changes, seal, track_objects
+
+
+class MapScript:
+    """脚本对地图的操作接口
+
+    rect 一律为格子范围 (r0, c0, r1, c1)（左闭右开）；对象坐标为世界坐标，
+    一格对应 tilesize 个单位（缺省取 map_info.tilesize，与文件中的坐标一致）。
+    """
+
+    def __init__(self, map_data, layers, tilesize=None):
+        self.map_data = map_data
+        self.layers = layers
+        self.tilesize = map_tilesize(map_data) if tilesize is None else tilesize
+        self.filepath = None
+        self.cell_format = CELL_TILE
+
+    @classmethod
+    def open(cls, filepath, tilesize=None):
+        """读取地图文件（不经过缓存），供命令行脚本使用"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            map_data = json.load(f)
+        rows = map_data.pop('map', [])
+        grids = extract_layer_grids(map_data)
+        grids[TERRAIN] = codes_from_rows(rows)
+        layers, _ = build_layers(map_data, grids)
+        script = cls(map_data, layers, tilesize)
+        script.filepath = filepath
+        script.cell_format = cell_format_of(rows)
+        return script
+
+    def save(self, filepath=None, cell_format=None):
+        """写回地图文件"""
+        extra = prepare_for_write(self.map_data, self.layers)
+        write_map(filepath or self.filepath, self.map_data, self.codes, cell_format or self.cell_format, extra)
+
+    # ---- 网格 ----
+
+    @property
+    def codes(self):
+        """terrain 图层的编码网格（可直接切片赋值）"""
+        return self.layers[TERRAIN].codes
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def layer(self, name=TERRAIN):
+        """图层的编码网格"""
+        return self.layers[name].codes
+
+    def region(self, r0, c0, r1, c1, layer=TERRAIN):
+        """矩形范围的网格视图，修改会直接写回图层"""
+        return self.layers[layer].codes[r0:r1, c0:c1]
+
+    def _target(self, rect, layer, where):
+        """rect 内的网格视图，以及与之同形的 where 掩码（缺省为全部）"""
+        codes = self.layers[layer].codes
+        r0, c0, r1, c1 = rect if rect is not None else (0, 0) + codes.shape
+        view = codes[r0:r1, c0:c1]
+        mask = np.ones(view.shape, dtype=bool) if where is None else np.asarray(where)[r0:r1, c0:c1]
+        return view, mask
+
+    def replace(self, old, new, rect=None, layer=TERRAIN, where=None):
+        """把 old（一个 code 或 code 列表）替换为 new，返回修改的格子数"""
+        view, mask = self._target(rect, layer, where)
+        hit = mask & np.isin(view, np.atleast_1d(old))
+        view[hit] = new
+        return int(hit.sum())
+
+    def fill(self, code, rect=None, layer=TERRAIN, where=None):
+        """把范围内（且满足 where）的格子填为 code，返回修改的格子数"""
+        view, mask = self._target(rect, layer, where)
+        view[mask] = code
+        return int(mask.sum())
+
+    def code_mask(self, *codes, layer=TERRAIN):
+        """code 属于给定值之一的格子"""
+        return np.isin(self.layers[layer].codes, np.array(codes, dtype=np.int64))
+
+    def prop_mask(self, layer=TERRAIN, **props):
+        """地砖属性满足 props 的格子，如 prop_mask(walkable=True)；调色板中没有的 code 不计"""
+        codes = self.layers[layer].codes
+        palette = palette_named(self.map_data, self.layers[layer].palette)
+        size = max([int(codes.max()) + 1 if codes.size else 1] + [int(k) + 1 for k in palette])
+        lut = np.zeros(size, dtype=bool)
+        for key, info in palette.items():
+            if isinstance(info, dict) and all(info.get(p) == v for p, v in props.items()):
+                lut[int(key)] = True
+        return lut[codes]
+
+    def rect_mask(self, r0, c0, r1, c1):
+        """矩形范围的掩码"""
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[r0:r1, c0:c1] = True
+        return mask
+
+    def floor_mask(self):
+        """可站立的格子：自身不可行走，正下方可行走"""
+        walkable = self.prop_mask(walkable=True)
+        floor = np.zeros_like(walkable)
+        floor[:-1] = ~walkable[:-1] & walkable[1:]
+        return floor
+
+    # ---- 对象 ----
+
+    def _objects(self, kind):
+        if kind not in OBJECT_POS_KEYS:
+            raise ValueError(u"对象种类应为 {}".format(" / ".join(OBJECT_POS_KEYS)))
+        return self.map_data.setdefault(kind, [])
+
+    def positions(self, kind):
+        """对象坐标 (N, 2) 数组"""
+        pos_key = OBJECT_POS_KEYS[kind]
+        return np.array([obj[pos_key] for obj in self._objects(kind)], dtype=float).reshape(-1, 2)
+
+    def cell_positions(self, mask):
+        """掩码中格子的世界坐标 (N, 2)（格子左上角）"""
+        r, c = np.nonzero(mask)
+        return np.column_stack([c, r]) * self.tilesize
+
+    def scatter(self, mask, count, seed=None, spacing=0):
+        """从掩码中随机不重复地选 count 个格子，返回世界坐标 (N, 2)
+
+        spacing > 0 时同一 spacing x spacing 格的方块内最多选一个，避免扎堆。
+        """
+        r, c = np.nonzero(mask)
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(r.size)
+        if spacing > 0:
+            cols = -(-self.shape[1] // spacing)
+            bucket = (r[order] // spacing) * cols + c[order] // spacing
+            _, first = np.unique(bucket, return_index=True)
+            order = order[np.sort(first)]
+        pick = order[:count]
+        return np.column_stack([c[pick], r[pick]]) * self.tilesize
+
+    def select(self, kind, rect=None, where=None):
+        """选出对象：rect 为世界坐标范围 (x0, y0, x1, y1)，where 为接收 (N, 2) 坐标、返回布尔数组的函数"""
+        pos = self.positions(kind)
+        hit = np.ones(len(pos), dtype=bool)
+        if rect is not None:
+            x0, y0, x1, y1 = rect
+            hit &= (pos[:, 0] >= x0) & (pos[:, 0] < x1) & (pos[:, 1] >= y0) & (pos[:, 1] < y1)
+        if where is not None:
+            hit &= np.asarray(where(pos), dtype=bool)
+        return hit
+
+    def _set_positions(self, kind, pos, hit):
+        pos_key = OBJECT_POS_KEYS[kind]
+        objs = self._objects(kind)
+        for i in np.flatnonzero(hit):
+            objs[i][pos_key] = [_number(v) for v in pos[i]]
+        return int(np.count_nonzero(hit))
+
+    def transform(self, kind, fn, selected=None):
+        """用 fn((N, 2) 坐标) -> (N, 2) 坐标 变换对象位置，返回变换的对象数"""
+        pos = self.positions(kind)
+        hit = np.ones(len(pos), dtype=bool) if selected is None else np.asarray(selected, dtype=bool)
+        if not hit.any():
+            return 0
+        pos[hit] = np.asarray(fn(pos[hit]), dtype=float).reshape(-1, 2)
+        return self._set_positions(kind, pos, hit)
+
+    def translate(self, kind, dx, dy, selected=None):
+        """平移对象，返回平移的对象数"""
+        return self.transform(kind, lambda pos: pos + (dx, dy), selected)
+
+    def remove(self, kind, selected=None):
+        """删除对象（缺省为全部），返回删除的对象数"""
+        objs = self._objects(kind)
+        hit = np.ones(len(objs), dtype=bool) if selected is None else np.asarray(selected, dtype=bool)
+        objs[:] = [obj for obj, drop in zip(objs, hit) if not drop]
+        return int(hit.sum())
+
+    def add_enemies(self, positions, id=1, delay=0):
+        """批量添加敌人；id、delay 可以是单个值或与坐标等长的数组，返回添加的数量"""
+        pos = np.asarray(positions, dtype=float).reshape(-1, 2)
+        ids = np.broadcast_to(id, len(pos))
+        delays = np.broadcast_to(delay, len(pos))
+        self._objects("enemy").extend(
+            {"id": _number(i), "spawn": [_number(x), _number(y)], "delay": _number(d)}
+            for (x, y), i, d in zip(pos.tolist(), ids.tolist(), delays.tolist())
+        )
+        return len(pos)
+
+    def add_entities(self, positions, **fields):
+        """批量添加实体，id 自动分配（接在现有最大 id 之后），返回添加的数量"""
+        pos = np.asarray(positions, dtype=float).reshape(-1, 2)
+        objs = self._objects("entity")
+        next_id = max([obj.get('id', 0) for obj in objs] + [0]) + 1
+        for i, (x, y) in enumerate(pos.tolist()):
+            obj = {"id": next_id + i, "position": [_number(x), _number(y)]}
+            obj.update(copy.deepcopy(fields))
+            objs.append(obj)
+        return len(pos)
+
+
+def _number(value):
+    """整数值写成 int，便于 JSON 保持原样"""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def _changed_rect(before, after):
+    """两个网格中变化格子的外接矩形 (r0, c0, r1, c1)；没有变化时返回 None"""
+    diff = before != after
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(diff[rows[0]:rows[-1] + 1].any(axis=0))
+    return int(rows[0]), int(cols[0]), int(rows[-1]) + 1, int(cols[-1]) + 1
+
+
+def run_script(script, source, filename="<script>"):
+    """执行一段脚本，整体作为一次修改
+
+    返回 (是否成功, 输出文本, 撤销记录列表)。撤销记录与 mapStamps.snapshot 的格式相同并带
+    layer 字段，每个被修改的图层一条，对象的增删改记在第一条中；修改过的图层标记为需要保存。
+    脚本出错时回滚全部修改。
+    """
+    before = {name: layer.codes.copy() for name, layer in script.layers.items()}
+    objects = track_objects(script.map_data)
+    spawn = copy.deepcopy(script.map_data.get('playerSpawn'))
+    out = io.StringIO()
+    ok = True
+    with contextlib.redirect_stdout(out):
+        try:
+            exec(compile(source, filename, 'exec'), {"m": script, "np": np, "__name__": "__mapscript__"})
+        except Exception:
+            ok = False
+            # 不显示 run_script 自身这一层调用
+            etype, value, tb = sys.exc_info()
+            traceback.print_exception(etype, value, tb.tb_next, file=out)
+
+    if not ok:
+        for name, codes in before.items():
+            script.layers[name].codes[...] = codes
+        for key, items in objects.items():
+            for obj, old in items:
+                obj.clear()
+                obj.update(old)
+            script.map_data[key] = [obj for obj, _ in items]
+        if spawn is not None:
+            script.map_data['playerSpawn'] = spawn
+        return False, out.getvalue(), []
+
+    records = []
+    for name, layer in script.layers.items():
+        rect = _changed_rect(before[name], layer.codes)
+        if rect is None:
+            continue
+        r0, c0, r1, c1 = rect
+        record = {"rect": rect, "codes": before[name][r0:r1, c0:c1].copy(), "layer": name}
+        seal(record, layer.codes)
+        records.append(record)
+        layer.persist = True
+    added, removed, modified = object_changes(objects, script.map_data)
+    if (added or removed or modified) and not records:
+        # 只改了对象：记录一个空的地砖范围
+        records.append({"rect": (0, 0, 0, 0), "codes": np.zeros((0, 0), dtype=CODE_DTYPE), "layer": TERRAIN})
+    if records:
+        records[0].update(added=added, removed=removed, modified=modified)
+    return True, out.getvalue(), records
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=u"对地图执行批量修改脚本")
+    parser.add_argument("map", help=u"地图 JSON")
+    parser.add_argument("script", help=u"脚本文件（可使用 m 与 np）")
+    parser.add_argument("-o", "--output", help=u"输出路径，缺省覆盖原地图")
+    parser.add_argument("--dry-run", action="store_true", help=u"只执行不保存")
+    parser.add_argument("--codes", action="store_true", help=u"网格只写地砖 code")
+    parser.add_argument("--tilesize", type=float, help=u"每格的世界坐标单位，缺省取 map_info.tilesize")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    script = MapScript.open(args.map, args.tilesize)
+    with open(args.script, 'r', encoding='utf-8') as f:
+        source = f.read()
+    started = time.perf_counter()
+    ok, output, records = run_script(script, source, args.script)
+    elapsed = time.perf_counter() - started
+    sys.stdout.write(output)
+    if not ok:
+        print(u"脚本出错，地图未修改")
+        return 1
+    changed = u"，".join(u"{} {}x{}".format(r['layer'], r['rect'][3] - r['rect'][1], r['rect'][2] - r['rect'][0])
+                        for r in records if r['codes'].size) or u"无地砖变化"
+    print(u"脚本耗时 {:.3f}s，修改: {}".format(elapsed, changed))
+    if records and not args.dry_run:
+        script.save(args.output, CELL_CODE if args.codes else None)
+        print(u"已保存: {}".format(args.output or args.map))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+矩形区域的复制/粘贴与图章库
+
+区域以编码数组保存地砖，实体与敌人以相对区域左上角的坐标保存。
+"""
+import base64
+import copy
+import json
+import os
+import zlib
+
+import numpy as np
+
+from mapGrid import CODE_DTYPE, OBJECT_POS_KEYS
+
+
+class Region:
+    """一块可复用的地图区域"""
+
+    def __init__(self, codes, objects=None):
+        self.codes = np.ascontiguousarray(codes, dtype=CODE_DTYPE)
+        self.objects = objects or {key: [] for key in OBJECT_POS_KEYS}
+
+    @property
+    def height(self):
+        return self.codes.shape[0]
+
+    @property
+    def width(self):
+        return self.codes.shape[1]
+
+    def to_dict(self):
+        """序列化：地砖压缩后以 base64 保存"""
+        raw = zlib.compress(self.codes.astype('<u2').tobytes())
+        return {
+            "w": self.width,
+            "h": self.height,
+            "codes": base64.b64encode(raw).decode('ascii'),
+            "objects": self.objects,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        raw = zlib.decompress(base64.b64decode(data['codes']))
+        codes = np.frombuffer(raw, dtype='<u2').reshape(data['h'], data['w'])
+        return cls(codes, copy.deepcopy(data.get('objects')))
+
+
+def objects_in_rect(map_data, x0, y0, x1, y1):
+    """返回 {key: [(下标, 对象)]}，对象坐标落在 [x0, x1) x [y0, y1) 内"""
+    found = {}
+    for key, pos_key in OBJECT_POS_KEYS.items():
+        found[key] = [
+            (i, obj) for i, obj in enumerate(map_data.get(key, []))
+            if x0 <= obj[pos_key][0] < x1 and y0 <= obj[pos_key][1] < y1
+        ]
+    return found
+
+
+def copy_region(map_data, codes, r0, c0, r1, c1, tilesize):
+    """复制 [r0, r1) x [c0, c1) 范围的地砖与其中的对象"""
+    x0, y0 = c0 * tilesize, r0 * tilesize
+    objects = {}
+    for key, items in objects_in_rect(map_data, x0, y0, c1 * tilesize, r1 * tilesize).items():
+        pos_key = OBJECT_POS_KEYS[key]
+        objects[key] = []
+        for _, obj in items:
+            rel = copy.deepcopy(obj)
+            rel[pos_key] = [obj[pos_key][0] - x0, obj[pos_key][1] - y0]
+            objects[key].append(rel)
+    return Region(codes[r0:r1, c0:c1].copy(), objects)
+
+
+def snapshot(map_data, codes, r0, c0, r1, c1):
+    """记录一次区域修改前的地砖，供撤销使用
+
+    对象只记录这次修改本身的增删（由 clear_region / paste_region 写入 added / removed），
+    撤销时不影响之后对其他对象的修改。
+    """
+    return {
+        "rect": (r0, c0, r1, c1),
+        "codes": codes[r0:r1, c0:c1].copy(),
+        "added": {},
+        "removed": {},
+    }
+
+
+def seal(record, codes):
+    """修改完成后记下这次写入的地砖，撤销时据此判断哪些格子之后又被改过"""
+    r0, c0, r1, c1 = record['rect']
+    record['after'] = codes[r0:r1, c0:c1].copy()
+
+
+def restore(map_data, codes, record):
+    """撤销：恢复记录的地砖，删去新增的对象、放回删除的对象、还原改动过的对象，返回受影响的格子范围
+
+    记录经过 seal 时只恢复仍保持这次写入内容的格子，之后在区域内的其他修改（画笔、外部修改等）保留。
+    """
+    r0, c0, r1, c1 = record['rect']
+    block = codes[r0:r1, c0:c1]
+    after = record.get('after')
+    if after is None:
+        block[...] = record['codes']
+    else:
+        keep = block == after
+        block[keep] = record['codes'][keep]
+    for obj, old in record.get('modified', []):
+        obj.clear()
+        obj.update(old)
+    for key, objs in record.get('added', {}).items():
+        added = {id(obj) for obj in objs}
+        current = map_data.setdefault(key, [])
+        current[:] = [obj for obj in current if id(obj) not in added]
+    for key, items in record.get('removed', {}).items():
+        current = map_data.setdefault(key, [])
+        for i, obj in items:
+            current.insert(min(i, len(current)), obj)
+    return record['rect']
+
+
+def track_objects(map_data):
+    """记下各对象列表当前的对象及其内容副本，供 object_changes 比较"""
+    return {key: [(obj, copy.deepcopy(obj)) for obj in map_data.get(key, [])] for key in OBJECT_POS_KEYS}
+
+
+def object_changes(tracked, map_data):
+    """与 track_objects 的记录比较，返回 (新增 {key: [对象]}, 删除 {key: [(原下标, 对象)]}, 改动 [(对象, 原内容)])"""
+    added, removed, modified = {}, {}, []
+    for key, items in tracked.items():
+        current = map_data.get(key, [])
+        before = {id(obj) for obj, _ in items}
+        now = {id(obj) for obj in current}
+        new = [obj for obj in current if id(obj) not in before]
+        gone = [(i, obj) for i, (obj, _) in enumerate(items) if id(obj) not in now]
+        if new:
+            added[key] = new
+        if gone:
+            removed[key] = gone
+        modified += [(obj, old) for obj, old in items if obj != old]
+    return added, removed, modified
+
+
+def clear_region(map_data, codes, r0, c0, r1, c1, tilesize, fill_code=1, record=None):
+    """清空区域：地砖填为 fill_code，删除其中的对象（record 不为空时把删除的对象记入其中）"""
+    codes[r0:r1, c0:c1] = fill_code
+    if record is not None:
+        seal(record, codes)
+    inside = objects_in_rect(map_data, c0 * tilesize, r0 * tilesize, c1 * tilesize, r1 * tilesize)
+    for key, items in inside.items():
+        drop = {i for i, _ in items}
+        if drop:
+            objs = map_data.get(key, [])
+            objs[:] = [obj for i, obj in enumerate(objs) if i not in drop]
+            if record is not None:
+                record['removed'][key] = items
+
+
+def paste_region(map_data, codes, region, row, col, tilesize, record=None):
+    """把区域贴到 (row, col)，超出地图的部分被裁掉
+
+    地砖一次切片写入；实体重新分配 id，敌人保留 id（敌人种类）。record 不为空时把新增的对象记入其中。
+    返回实际写入的格子范围 (r0, c0, r1, c1)，没有写入时返回 None。
+    """
+    rows, cols = codes.shape
+    r0, c0 = max(row, 0), max(col, 0)
+    r1, c1 = min(row + region.height, rows), min(col + region.width, cols)
+    if r0 >= r1 or c0 >= c1:
+        return None
+    codes[r0:r1, c0:c1] = region.codes[r0 - row:r1 - row, c0 - col:c1 - col]
+    if record is not None:
+        seal(record, codes)
+
+    ox, oy = col * tilesize, row * tilesize
+    x0, y0, x1, y1 = c0 * tilesize, r0 * tilesize, c1 * tilesize, r1 * tilesize
+    for key, pos_key in OBJECT_POS_KEYS.items():
+        objs = map_data.setdefault(key, [])
+        next_id = max([obj.get('id', 0) for obj in objs] + [0]) + 1
+        for rel in region.objects.get(key, []):
+            x, y = rel[pos_key][0] + ox, rel[pos_key][1] + oy
+            if not (x0 <= x < x1 and y0 <= y < y1):
+                continue
+            obj = copy.deepcopy(rel)
+            obj[pos_key] = [x, y]
+            if key == "entity":
+                obj['id'] = next_id
+                next_id += 1
+            objs.append(obj)
+            if record is not None:
+                record['added'].setdefault(key, []).append(obj)
+    return r0, c0, r1, c1
+
+
+def load_stamps(filepath):
+    """读取图章库，返回 {名称: Region}"""
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: Region.from_dict(item) for name, item in data.items()}
+
+
+def save_stamps(filepath, stamps):
+    """写入图章库"""
+    data = {name: region.to_dict() for name, region in stamps.items()}
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
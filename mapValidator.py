@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+地图完整性检查
+
+    python3 mapValidator.py start_cave.json [other.json ...]
+
+每条问题是一个 dict：
+    severity  "error" / "warning"
+    check     检查项名称
+    message   说明
+    rect      出问题的格子范围 (x, y, w, h)，可选
+    pos       出问题的世界坐标 (x, y)，可选
+    count     涉及的格子/对象数量
+"""
+import json
+import sys
+
+import numpy as np
+
+from mapDiff import changed_rects
+from mapGrid import CODE_DTYPE, OBJECT_POS_KEYS, ragged_rows
+from mapLayers import DEFAULT_LAYER_META, EMPTY_CODE, TERRAIN, palette_named
+
+
+ERROR = "error"
+WARNING = "warning"
+
+# 单项检查最多报告的条数，其余合并为一条汇总
+MAX_ISSUES_PER_CHECK = 100
+
+# 编码网格能表示的最大地砖 code
+CODE_MAX = int(np.iinfo(CODE_DTYPE).max)
+
+
+def _issue(severity, check, message, rect=None, pos=None, count=1):
+    return {"severity": severity, "check": check, "message": message,
+            "rect": rect, "pos": pos, "count": int(count)}
+
+
+def _limit(issues, check, total):
+    """截断过多的同类问题并追加一条汇总"""
+    if len(issues) <= MAX_ISSUES_PER_CHECK:
+        return issues
+    rest = issues[MAX_ISSUES_PER_CHECK:]
+    kept = issues[:MAX_ISSUES_PER_CHECK]
+    kept.append(_issue(rest[0]['severity'], check,
+                       u"另有 {} 处同类问题（共 {}）".format(len(rest), total),
+                       count=sum(i['count'] for i in rest)))
+    return kept
+
+
+def _cell_value(cell):
+    """单个格子（数字或含 code 的 dict）的地砖 code，无法识别时返回 None"""
+    if isinstance(cell, dict):
+        cell = cell.get('code')
+    if isinstance(cell, bool):
+        return None
+    if isinstance(cell, int):
+        return cell
+    if isinstance(cell, float) and cell.is_integer():
+        return int(cell)
+    return None
+
+
+def _int_row(row):
+    """整行都是整数时一次转换为数组，否则返回 None（逐格检查）"""
+    if not row or isinstance(row[0], dict):
+        return None
+    try:
+        values = np.asarray(row)
+    except (ValueError, OverflowError):
+        return None
+    if values.ndim != 1 or values.dtype.kind not in 'iu':
+        return None
+    return values.astype(np.int64)
+
+
+def scan_rows(rows, default=1):
+    """检查原始的 map 行并转换为编码网格，不合法的格子按 default 读入
+
+    返回 (codes, invalid, overflow)：invalid 标出无法识别的格子（非数字、缺少 code），
+    overflow 标出超出 0..CODE_MAX 的 code。rows 中的每一行应已是列表。
+    """
+    width = max((len(row) for row in rows), default=0)
+    codes = np.full((len(rows), width), default, dtype=CODE_DTYPE)
+    invalid = np.zeros(codes.shape, dtype=bool)
+    overflow = np.zeros(codes.shape, dtype=bool)
+    for r, row in enumerate(rows):
+        n = len(row)
+        values = _int_row(row)
+        if values is None:
+            values = np.zeros(n, dtype=np.int64)
+            for c, cell in enumerate(row):
+                value = _cell_value(cell)
+                if value is None:
+                    invalid[r, c] = True
+                elif 0 <= value <= CODE_MAX:
+                    values[c] = value
+                else:
+                    overflow[r, c] = True
+        else:
+            overflow[r, :n] = (values < 0) | (values > CODE_MAX)
+        good = ~(invalid[r, :n] | overflow[r, :n])
+        codes[r, :n][good] = values[good]
+    return codes, invalid, overflow
+
+
+def _mask_issues(mask, check, message):
+    """把格子掩码按区域归并为问题"""
+    issues = [_issue(ERROR, check, message, rect=(x, y, w, h), count=mask[y:y + h, x:x + w].sum())
+              for x, y, w, h in changed_rects(mask)]
+    return _limit(issues, check, int(mask.sum()))
+
+
+def check_cells(invalid, overflow, title=u""):
+    """无法识别的格子与超出范围的 code（这些格子已按默认地砖读入）"""
+    issues = []
+    if invalid.any():
+        issues += _mask_issues(invalid, "bad_cell", u"{}格子不是地砖 code（非数字或缺少 code 字段）".format(title))
+    if overflow.any():
+        issues += _mask_issues(overflow, "code_range", u"{}地砖 code 超出 0..{}".format(title, CODE_MAX))
+    return issues
+
+
+def _int_keys(table):
+    """调色板（tile_info 等）中能作为 code 的整数键"""
+    keys = set()
+    for key in table:
+        try:
+            keys.add(int(key))
+        except ValueError:
+            pass
+    return keys
+
+
+def _tile_info(map_data):
+    tile_info = map_data.get('tile_info', {})
+    return tile_info if isinstance(tile_info, dict) else {}
+
+
+def _unknown_codes(codes, known, check, title):
+    """网格中不在 known 里的 code，按区域归并报告"""
+    bad = ~np.isin(codes, np.array(sorted(known), dtype=np.int64))
+    if not bad.any():
+        return []
+    issues = []
+    for x, y, w, h in changed_rects(bad):
+        block = codes[y:y + h, x:x + w][bad[y:y + h, x:x + w]]
+        found = ", ".join(str(c) for c in np.unique(block)[:8])
+        issues.append(_issue(ERROR, check, u"{}未定义的地砖 code: {}".format(title, found),
+                             rect=(x, y, w, h), count=block.size))
+    return _limit(issues, check, int(bad.sum()))
+
+
+def check_tile_codes(map_data, codes):
+    """网格中出现了 tile_info 里没有的地砖 code"""
+    return _unknown_codes(codes, _int_keys(_tile_info(map_data)), "unknown_tile", u"")
+
+
+def check_layers(map_data, codes, layers, mismatch):
+    """非 terrain 图层：尺寸与 terrain 不符，或出现调色板里没有的 code（空 code 除外）
+
+    layers 为 {图层名: (调色板名, 编码网格)}。
+    """
+    issues = []
+    for name in mismatch:
+        issues.append(_issue(ERROR, "layer_shape", u"图层 {} 的尺寸与 terrain ({}x{}) 不一致，已裁剪/补齐".format(
+            name, codes.shape[1], codes.shape[0])))
+    for name, (palette, grid) in layers.items():
+        table = palette_named(map_data, palette)
+        known = (_int_keys(table) if isinstance(table, dict) else set()) | {EMPTY_CODE}
+        issues += _unknown_codes(grid, known, "unknown_layer_tile", u"图层 {} 中".format(name))
+    return issues
+
+
+def check_tile_info(map_data):
+    """tile_info 格式错误、键不是整数，或键与其中的 code 字段不一致"""
+    if not isinstance(map_data.get('tile_info', {}), dict):
+        return [_issue(ERROR, "tile_info", u"tile_info 格式错误")]
+    issues = []
+    for key, info in map_data.get('tile_info', {}).items():
+        if not _int_keys([key]):
+            issues.append(_issue(ERROR, "tile_info", u"tile_info 的键 {} 不是整数 code".format(json.dumps(key))))
+        elif not isinstance(info, dict) or str(info.get('code')) != str(key):
+            issues.append(_issue(WARNING, "tile_info", u"tile_info[{}] 的 code 字段与键不一致".format(key)))
+    return issues
+
+
+def check_ragged(ragged, width):
+    """行长度不一致（读取时已用默认地砖补齐）"""
+    issues = [
+        _issue(ERROR, "ragged_row", u"第 {} 行长度为 {}，应为 {}".format(r, length, width),
+               rect=(min(length, width - 1), r, max(width - length, 1), 1))
+        for r, length in ragged
+    ]
+    return _limit(issues, "ragged_row", len(ragged))
+
+
+def check_map_info(map_data, codes):
+    """map_info 缺失，或宽高与 tilesize x 网格尺寸不符"""
+    info = map_data.get('map_info')
+    if not isinstance(info, dict):
+        return [_issue(ERROR, "map_info", u"缺少 map_info")]
+    rows, cols = codes.shape
+    tilesize = info.get('tilesize')
+    if not isinstance(tilesize, (int, float)) or tilesize <= 0:
+        return [_issue(ERROR, "map_info", u"map_info.tilesize 无效: {}".format(tilesize))]
+    issues = []
+    if info.get('width') != cols * tilesize:
+        issues.append(_issue(ERROR, "map_info", u"map_info.width={}，网格 {} 列 x tilesize {} = {}".format(
+            info.get('width'), cols, tilesize, cols * tilesize)))
+    if info.get('height') != rows * tilesize:
+        issues.append(_issue(ERROR, "map_info", u"map_info.height={}，网格 {} 行 x tilesize {} = {}".format(
+            info.get('height'), rows, tilesize, rows * tilesize)))
+    return issues
+
+
+def _positions(objs, pos_key):
+    """把对象坐标整理为 (N, 2) 数组，格式不对的记为 NaN"""
+    pos = np.full((len(objs), 2), np.nan)
+    for i, obj in enumerate(objs):
+        p = obj.get(pos_key) if isinstance(obj, dict) else None
+        if isinstance(p, (list, tuple)) and len(p) == 2 and all(isinstance(v, (int, float)) for v in p):
+            pos[i] = p
+    return pos
+
+
+def _valid_id(value):
+    """id 必须是整数（不接受布尔值、小数与字符串）"""
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+
+def check_objects(map_data):
+    """对象坐标格式错误或超出 map_info 范围，实体 id 重复，敌人重叠"""
+    info = map_data.get('map_info') or {}
+    width, height = info.get('width'), info.get('height')
+    titles = {"entity": u"实体", "enemy": u"敌人"}
+    issues = []
+
+    for key, pos_key in OBJECT_POS_KEYS.items():
+        objs = map_data.get(key) or []
+        if not isinstance(objs, list):
+            issues.append(_issue(ERROR, "bad_object", u"{}列表格式错误".format(titles[key])))
+            continue
+        if not objs:
+            continue
+        pos = _positions(objs, pos_key)
+        malformed = np.isnan(pos).any(axis=1)
+        for i in np.flatnonzero(malformed):
+            issues.append(_issue(ERROR, "bad_object", u"{} #{} 的 {} 格式错误".format(titles[key], i, pos_key)))
+
+        if isinstance(width, (int, float)) and isinstance(height, (int, float)):
+            x, y = pos[:, 0], pos[:, 1]
+            outside = ~malformed & ((x < 0) | (x >= width) | (y < 0) | (y >= height))
+            for i in np.flatnonzero(outside):
+                issues.append(_issue(ERROR, "out_of_bounds", u"{} #{} (id={}) 位于地图范围外: {}".format(
+                    titles[key], i, objs[i].get('id'), objs[i][pos_key]), pos=tuple(pos[i].tolist())))
+
+        raw_ids = [obj.get('id') if isinstance(obj, dict) else None for obj in objs]
+        valid = np.array([_valid_id(v) for v in raw_ids], dtype=bool)
+        for i in np.flatnonzero(~valid):
+            issues.append(_issue(ERROR, "bad_id", u"{} #{} 的 id 无效: {}".format(
+                titles[key], i, json.dumps(raw_ids[i], ensure_ascii=False)),
+                pos=None if malformed[i] else tuple(pos[i].tolist())))
+        # 只比较有效的 id
+        sel = np.flatnonzero(valid)
+        ids = np.array([raw_ids[i] for i in sel], dtype=np.int64)
+        if key == "entity":
+            # 实体 id 应唯一
+            _, inverse, counts = np.unique(ids, return_inverse=True, return_counts=True)
+            for j in np.flatnonzero(counts[inverse] > 1):
+                i = sel[j]
+                issues.append(_issue(ERROR, "duplicate_id", u"实体 id={} 重复（{} 个）".format(
+                    ids[j], counts[inverse[j]]), pos=None if malformed[i] else tuple(pos[i].tolist())))
+        elif sel.size:
+            # 敌人的 id 表示种类，可以重复；同种敌人出现在同一位置多半是误操作
+            keyed = np.column_stack([ids, np.nan_to_num(pos[sel], nan=-1e18)])
+            _, inverse, counts = np.unique(keyed, axis=0, return_inverse=True, return_counts=True)
+            for j in np.flatnonzero(counts[inverse.ravel()] > 1):
+                i = sel[j]
+                issues.append(_issue(WARNING, "duplicate_enemy", u"敌人 #{} (id={}) 与同种敌人重叠".format(
+                    i, ids[j]), pos=None if malformed[i] else tuple(pos[i].tolist())))
+
+    spawn = map_data.get('playerSpawn')
+    if not isinstance(spawn, dict) or not all(isinstance(spawn.get(k), (int, float)) for k in ('x', 'y')):
+        issues.append(_issue(ERROR, "spawn", u"playerSpawn 缺失或格式错误"))
+    elif isinstance(width, (int, float)) and isinstance(height, (int, float)):
+        if not (0 <= spawn['x'] < width and 0 <= spawn['y'] < height):
+            issues.append(_issue(ERROR, "spawn", u"玩家生成点位于地图范围外: ({}, {})".format(
+                spawn['x'], spawn['y']), pos=(spawn['x'], spawn['y'])))
+    return issues
+
+
+def validate_map(map_data, codes, ragged=None, layers=None, layer_mismatch=None):
+    """检查一份地图（元数据 + 编码网格 + 其余图层），返回问题列表，错误排在前面"""
+    issues = []
+    issues += check_ragged(ragged or [], codes.shape[1])
+    issues += check_map_info(map_data, codes)
+    issues += check_tile_info(map_data)
+    issues += check_tile_codes(map_data, codes)
+    issues += check_layers(map_data, codes, layers or {}, layer_mismatch or [])
+    issues += check_objects(map_data)
+    issues.sort(key=lambda i: i['severity'] != ERROR)
+    return issues
+
+
+def validate_file(filepath):
+    """读取并检查地图文件"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        map_data = json.load(f)
+    if not isinstance(map_data, dict):
+        return [_issue(ERROR, "map", u"文件内容不是地图对象")]
+    rows = map_data.pop('map', None)
+    if not isinstance(rows, list):
+        return [_issue(ERROR, "map", u"缺少 map 网格")]
+    # 先检查原始的行与格子，再转换为编码网格，格式错误作为问题报告而不是抛出异常
+    issues = []
+    issues += [_issue(ERROR, "bad_row", u"第 {} 行不是数组".format(r)) for r, row in enumerate(rows)
+               if not isinstance(row, list)]
+    rows = [row if isinstance(row, list) else [] for row in rows]
+    codes, invalid, overflow = scan_rows(rows)
+    issues += check_cells(invalid, overflow)
+
+    metas = map_data.get('layers')
+    if metas is not None and not isinstance(metas, dict):
+        issues.append(_issue(ERROR, "layers", u"layers 格式错误"))
+        metas = map_data['layers'] = {}
+    layers = {}
+    for name, meta in (metas or {}).items():
+        if not isinstance(meta, dict) or 'map' not in meta:
+            continue
+        grid_rows = meta.pop('map')
+        if name == TERRAIN:
+            continue
+        if not isinstance(grid_rows, list) or not all(isinstance(row, list) for row in grid_rows):
+            issues.append(_issue(ERROR, "bad_row", u"图层 {} 的网格格式错误".format(name)))
+            continue
+        grid, invalid, overflow = scan_rows(grid_rows, EMPTY_CODE)
+        issues += check_cells(invalid, overflow, u"图层 {} 中".format(name))
+        default = DEFAULT_LAYER_META.get(name, {}).get('palette', "tile_info")
+        layers[name] = (meta.get('palette', default), grid)
+    mismatch = [name for name, (_, grid) in layers.items() if grid.shape != codes.shape]
+    issues += validate_map(map_data, codes, ragged_rows(rows), layers, mismatch)
+    issues.sort(key=lambda i: i['severity'] != ERROR)
+    return issues
+
+
+def format_issue(issue):
+    """单条问题的文字描述（含位置）"""
+    where = u""
+    if issue.get('rect'):
+        x, y, w, h = issue['rect']
+        where = u" @ 格子 x={} y={}".format(x, y) + (u" {}x{}".format(w, h) if (w, h) != (1, 1) else u"")
+    elif issue.get('pos'):
+        where = u" @ ({:g}, {:g})".format(*issue['pos'])
+    level = u"错误" if issue['severity'] == ERROR else u"警告"
+    return u"[{}] {}{}".format(level, issue['message'], where)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(u"用法: python3 mapValidator.py <地图.json> [...]")
+        return 2
+    failed = False
+    for filepath in argv:
+        issues = validate_file(filepath)
+        errors = sum(1 for i in issues if i['severity'] == ERROR)
+        print(u"{}: {} 个错误，{} 个警告".format(filepath, errors, len(issues) - errors))
+        for issue in issues:
+            print(u"  " + format_issue(issue))
+        failed = failed or errors > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+外部修改的增量重新加载
+
+编辑器打开地图时记下文件内容的摘要（由文件构造出的各图层按 CHUNK×CHUNK 分块的 sha1，
+以及每个顶层字段的 sha1；未写在文件中的图层按补出的内容计算，如由 terrain 推导的碰撞层），
+同时保留各图层网格的副本作为三方比较的基准。
+文件被其他工具改写后，在后台重新读取并求摘要，与记下的摘要比较得出磁盘上变化的块与字段，
+再与内存中的当前内容比较（三方比较）：
+
+    磁盘变了、本地没改          直接应用整块
+    磁盘变了、本地改成了同样的内容  跳过
+    磁盘变了、本地也改过且不同     在块内逐格与基准比较：只有磁盘改过的格子直接应用，
+                                两边都改过且不同的格子为冲突，保留本地内容并提示
+"""
+import hashlib
+import json
+
+import numpy as np
+
+from mapLayers import TERRAIN
+
+
+# 分块边长（格）
+CHUNK = 64
+
+
+def _digest(data):
+    return np.frombuffer(hashlib.sha1(data).digest(), dtype=np.uint8)
+
+
+def chunk_digests(codes, chunk=CHUNK):
+    """按块求 sha1，返回形状 (块行数, 块列数, 20) 的 uint8 数组"""
+    rows, cols = codes.shape
+    nby, nbx = -(-rows // chunk), -(-cols // chunk)
+    digests = np.empty((nby, nbx, 20), dtype=np.uint8)
+    for by in range(nby):
+        band = np.ascontiguousarray(codes[by * chunk:(by + 1) * chunk], dtype='<u2')
+        for bx in range(nbx):
+            digests[by, bx] = _digest(band[:, bx * chunk:(bx + 1) * chunk].tobytes())
+    return digests
+
+
+def chunk_rect(by, bx, shape, chunk=CHUNK):
+    """块对应的格子范围 (r0, c0, r1, c1)"""
+    r0, c0 = by * chunk, bx * chunk
+    return r0, c0, min(r0 + chunk, shape[0]), min(c0 + chunk, shape[1])
+
+
+def field_digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def field_digests(map_data):
+    """每个顶层字段（对象列表、生成点、tile_info 等）的摘要"""
+    return {key: field_digest(value) for key, value in map_data.items()}
+
+
+def grid_digests(grids, chunk=CHUNK):
+    """各图层网格 {图层名: 编码网格} 的分块摘要；codes 保留网格本身作为逐格比较的基准
+
+    grids 应为之后不再修改的副本。
+    """
+    return {
+        "shape": list(grids[TERRAIN].shape),
+        "grids": {name: chunk_digests(codes, chunk) for name, codes in grids.items()},
+        "codes": dict(grids),
+    }
+
+
+def map_digests(map_data, grids, chunk=CHUNK):
+    """文件内容的完整摘要：{"shape", "grids": {图层: 分块摘要}, "codes": {图层: 网格}, "fields": {字段: 摘要}}"""
+    digests = grid_digests(grids, chunk)
+    digests['fields'] = field_digests(map_data)
+    return digests
+
+
+class ReloadPlan:
+    """三方比较的结果：可直接应用的块与字段、冲突的格子与字段
+
+    chunks / conflicts 为 {图层名: [(rect, mask)]}：rect 为块的格子范围 (r0, c0, r1, c1)，
+    mask 为块内的布尔掩码（chunks 中为 None 时表示整块）。
+    """
+
+    def __init__(self):
+        self.chunks = {}
+        self.conflicts = {}
+        self.fields = []
+        self.field_conflicts = []
+        self.shape_changed = False
+
+    def chunk_count(self):
+        return sum(len(items) for items in self.chunks.values())
+
+    def conflict_cells(self):
+        return sum(int(mask.sum()) for items in self.conflicts.values() for _, mask in items)
+
+    def conflict_count(self):
+        return self.conflict_cells() + len(self.field_conflicts)
+
+    def __bool__(self):
+        return bool(self.chunks or self.conflicts or self.fields or self.field_conflicts or self.shape_changed)
+
+
+def merge_cells(local, base_codes, disk_codes, rect):
+    """块内逐格三方比较，返回 (只有磁盘改过、可直接应用的格子, 两边都改过且不同的冲突格子)
+
+    base_codes / disk_codes 为整张网格，缺失时返回 None。
+    """
+    if base_codes is None or disk_codes is None:
+        return None
+    r0, c0, r1, c1 = rect
+    base = base_codes[r0:r1, c0:c1]
+    new = disk_codes[r0:r1, c0:c1]
+    disk_changed = new != base
+    local_changed = local != base
+    return disk_changed & ~local_changed, disk_changed & local_changed & (local != new)
+
+
+def plan_reload(baseline, disk, map_data, layers, chunk=CHUNK):
+    """比较上次同步时的摘要 baseline、新文件的摘要 disk 与内存中的 map_data / layers
+
+    只对磁盘上变化的块求内存中的摘要；两边都改过的块按 baseline 与 disk 中保留的网格逐格合并。
+    """
+    plan = ReloadPlan()
+    if disk['shape'] != baseline['shape']:
+        plan.shape_changed = True
+        return plan
+
+    for name, disk_grid in disk['grids'].items():
+        if name not in layers or name not in baseline['grids']:
+            continue
+        base_grid = baseline['grids'][name]
+        codes = layers[name].codes
+        changed = (disk_grid != base_grid).any(axis=2)
+        for by, bx in zip(*np.nonzero(changed)):
+            rect = chunk_rect(int(by), int(bx), codes.shape, chunk)
+            r0, c0, r1, c1 = rect
+            block = codes[r0:r1, c0:c1]
+            local = _digest(np.ascontiguousarray(block, dtype='<u2').tobytes())
+            if (local == disk_grid[by, bx]).all():
+                continue
+            if (local == base_grid[by, bx]).all():
+                plan.chunks.setdefault(name, []).append((rect, None))
+                continue
+            merged = merge_cells(block, baseline.get('codes', {}).get(name), disk.get('codes', {}).get(name), rect)
+            if merged is None:
+                # 没有基准网格时无法逐格比较，整块作为冲突
+                plan.conflicts.setdefault(name, []).append((rect, np.ones(block.shape, dtype=bool)))
+                continue
+            take, conflict = merged
+            if take.any():
+                plan.chunks.setdefault(name, []).append((rect, take))
+            if conflict.any():
+                plan.conflicts.setdefault(name, []).append((rect, conflict))
+
+    base_fields, disk_fields = baseline['fields'], disk['fields']
+    for key in sorted(set(base_fields) | set(disk_fields)):
+        base, new = base_fields.get(key), disk_fields.get(key)
+        if new == base:
+            continue
+        local = field_digest(map_data[key]) if key in map_data else None
+        if local == new:
+            continue
+        (plan.fields if local == base else plan.field_conflicts).append(key)
+    return plan